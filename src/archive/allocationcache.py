@@ -0,0 +1,232 @@
+"""
+A persistent, on-disk cache of the allocations that have been computed.
+
+The same experiment designs come up again and again, and an allocation can
+take a long time to compute. So allocations are stored in a local SQLite
+database, keyed by a hash of everything that determines them:
+
+    the assay types, in priority order
+    the chambers
+    sim_targets
+    the dont-mix rules (as compiled by DontMixMasks)
+    the allocator's class name, and its VERSION
+
+An allocator that is changed in a way that alters the allocations it produces
+should have its VERSION increased, which retires its old cache entries. For an
+allocator without a VERSION, a digest of the source file that defines it is
+used instead, so that any change to that file retires its entries. (If there
+is no source to be had, as in a frozen executable, such an allocator's
+allocations are not cached at all.)
+
+Each entry stores a digest of its payload, which is checked whenever it is
+read. An entry that fails the check is deleted and treated as a miss. The
+cache is kept under a size limit by evicting the least recently used entries.
+
+Several processes (for example the workers of a DOE sweep) can use the same
+cache at once. SQLite's write-ahead log lets readers carry on while a writer
+writes, and each process waits its turn for the write lock.
+"""
+
+import errno
+import hashlib
+import inspect
+import json
+import os
+import sqlite3
+import time
+
+from lib.model import Allocation
+from lib.model.dontmixmasks import DontMixMasks
+
+
+# The environment variable that can be used to say where the cache lives.
+CACHE_PATH_VARIABLE = 'ASSAY_ALLOC_CACHE'
+
+# How long to wait for another process to release the write lock.
+_LOCK_TIMEOUT = 30.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS allocations (
+    key TEXT PRIMARY KEY,
+    payload BLOB NOT NULL,
+    digest TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    last_used REAL NOT NULL
+)
+"""
+
+
+class AllocationCache:
+    """
+    A size-bounded store of allocations, in an SQLite database file.
+    """
+
+    def __init__(self, path=None, max_bytes=64 * 1024 * 1024):
+        """
+        Path is the database file, which is created if need be. (By default,
+        that named by the ASSAY_ALLOC_CACHE environment variable, or else
+        ~/.assay-alloc/cache.sqlite.) Max_bytes limits the total size of the
+        payloads stored.
+        """
+        if path is None:
+            path = os.environ.get(CACHE_PATH_VARIABLE) or \
+                    os.path.expanduser('~/.assay-alloc/cache.sqlite')
+        directory = os.path.dirname(os.path.abspath(path))
+        try:
+            os.makedirs(directory)
+        except OSError as e:
+            # Another process may have just made it.
+            if e.errno != errno.EEXIST:
+                raise
+        self._max_bytes = max_bytes
+        # Autocommit mode. Transactions are begun explicitly below.
+        self._db = sqlite3.connect(path, timeout=_LOCK_TIMEOUT,
+                isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute(_SCHEMA)
+
+
+    def allocate(self, experiment_design, allocator_class):
+        """
+        Provides the allocation that allocator_class would make for the given
+        ExperimentDesign. From the cache if it is there, otherwise by running
+        the allocator (and storing the result).
+        """
+        key = self.key(experiment_design, allocator_class)
+        alloc = self.get(key)
+        if alloc is None:
+            alloc = allocator_class(experiment_design).allocate()
+            self.put(key, alloc)
+        return alloc
+
+
+    def get(self, key):
+        """
+        Provides the Allocation stored under the given key, or None.
+        """
+        if key is None:
+            return None
+        row = self._db.execute(
+                'SELECT payload, digest FROM allocations WHERE key = ?',
+                (key,)).fetchone()
+        if row is None:
+            return None
+        payload, digest = bytes(row[0]), row[1]
+        alloc = None
+        if hashlib.sha256(payload).hexdigest() == digest:
+            try:
+                alloc = _decode(payload)
+            except (ValueError, TypeError):
+                pass
+        if alloc is None:
+            # Damaged. Get rid of it, and compute it afresh.
+            self._db.execute('DELETE FROM allocations WHERE key = ?', (key,))
+            return None
+        self._db.execute('UPDATE allocations SET last_used = ? WHERE key = ?',
+                (time.time(), key))
+        return alloc
+
+
+    def put(self, key, alloc):
+        """
+        Stores the given Allocation under the given key, evicting the least
+        recently used entries if need be to keep within the size limit.
+        """
+        if key is None:
+            return
+        payload = _encode(alloc)
+        digest = hashlib.sha256(payload).hexdigest()
+        self._db.execute('BEGIN IMMEDIATE')
+        try:
+            self._db.execute('INSERT OR REPLACE INTO allocations '
+                    '(key, payload, digest, size, last_used) '
+                    'VALUES (?, ?, ?, ?, ?)',
+                    (key, sqlite3.Binary(payload), digest, len(payload),
+                    time.time()))
+            self._evict()
+            self._db.execute('COMMIT')
+        except sqlite3.Error:
+            self._db.execute('ROLLBACK')
+            raise
+
+
+    def close(self):
+        self._db.close()
+
+
+    @classmethod
+    def key(cls, experiment_design, allocator_class):
+        """
+        The cache key for the allocation that allocator_class would make for
+        the given ExperimentDesign. None if allocator_class cannot be
+        versioned, in which case get() finds nothing under it and put()
+        stores nothing.
+        """
+        version = _version_of(allocator_class)
+        if version is None:
+            return None
+        assays = experiment_design.assay_types_in_priority_order()
+        dont_mix = DontMixMasks(experiment_design)
+        description = {
+            'assays': list(assays),
+            'chambers': sorted(experiment_design.set_of_all_chambers()),
+            'sim_targets': experiment_design.sim_targets,
+            'dont_mix': [dont_mix.forbidden_partners(a) for a in assays],
+            'allocator': allocator_class.__name__,
+            'version': version,
+        }
+        canonical = json.dumps(description, sort_keys=True,
+                separators=(',', ':'))
+        return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+    #------------------------------------------------------------------------
+    # Private / implementation methods below.
+    #------------------------------------------------------------------------
+
+    def _evict(self):
+        total, = self._db.execute(
+                'SELECT COALESCE(SUM(size), 0) FROM allocations').fetchone()
+        if total <= self._max_bytes:
+            return
+        rows = self._db.execute(
+                'SELECT key, size FROM allocations ORDER BY last_used')
+        doomed = []
+        for key, size in rows.fetchall():
+            if total <= self._max_bytes:
+                break
+            doomed.append((key,))
+            total -= size
+        self._db.executemany('DELETE FROM allocations WHERE key = ?', doomed)
+
+
+def _version_of(allocator_class):
+    """
+    The allocator's VERSION, or failing that, the sha256 of its source file.
+    None if neither is to be had.
+    """
+    version = getattr(allocator_class, 'VERSION', None)
+    if version is not None:
+        return version
+    try:
+        with open(inspect.getsourcefile(allocator_class), 'rb') as f:
+            return 'source:' + hashlib.sha256(f.read()).hexdigest()
+    except (TypeError, IOError, OSError):
+        return None
+
+
+def _encode(alloc):
+    """
+    The allocation as JSON: a list of [assay, [chambers]] pairs, in the order
+    the assays were allocated.
+    """
+    entries = [[assay, sorted(alloc.chambers_for(assay))] for
+            assay in alloc.all_assays()]
+    return json.dumps(entries, separators=(',', ':')).encode('utf-8')
+
+
+def _decode(payload):
+    alloc = Allocation()
+    for assay, chambers in json.loads(payload.decode('utf-8')):
+        alloc.allocate(assay, frozenset(chambers))
+    return alloc
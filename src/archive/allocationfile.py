@@ -0,0 +1,348 @@
+"""
+A compact, versioned binary file format for allocations, for the tools that
+load plates from an allocation, decode runs, or verify it, to read without
+parsing the text report.
+
+The file can be memory-mapped and read in place. Nothing is unpacked until it
+is asked for, and the bit matrices can be handed to NumPy as arrays without
+being copied. Checking the CRC-32 means reading the whole file, so that is
+only done when asked for.
+
+The assay types must be strings. (They are stored as UTF-8 names, and read
+back as such.)
+
+LAYOUT
+
+All integers are little-endian. Each section starts on an 8 byte boundary.
+
+    Header          Magic b'AALC', format version, the numbers of assay types
+                    and chambers, sim_targets, the words per row of each bit
+                    matrix, the offset of each section, the file size, and
+                    a CRC-32 of everything after the header.
+
+    Assay names     (num_assays + 1) uint32 offsets into the UTF-8 text that
+                    follows them. The assay types are in priority order.
+
+    Chambers        num_chambers int32 chamber numbers, in ascending order.
+
+    Reserved sets   num_assays rows of uint64 words. Bit i of a row (bit
+                    i % 64 of word i // 64) is set when the assay's reserved
+                    chamber set includes the i'th chamber.
+
+    Occupancy       num_chambers rows of uint64 words. Bit j of a row is set
+                    when the j'th assay type is in the chamber.
+
+    Dont-mix        num_assays rows of uint64 words. Bit j of a row is set
+                    when the assay type must not share a chamber with the
+                    j'th assay type.
+
+The reserved sets and the occupancy are the same information, by assay and by
+chamber, because each kind of reader wants it a different way round. (The
+FiringDecoder by assay, plate loading by chamber.)
+
+A reader must refuse a file whose version it does not know. Increase
+FORMAT_VERSION whenever the layout changes.
+
+An AllocationFile provides all_assays() and chambers_for(), so it can be
+given to anything that reads an Allocation without changing it, such as the
+FalsePositiveCertifier and the ResilienceSimulator.
+"""
+
+import mmap
+import struct
+import zlib
+
+from lib.model import Allocation
+from lib.model.dontmixmasks import DontMixMasks
+
+
+FORMAT_VERSION = 1
+
+_MAGIC = b'AALC'
+
+try:
+    _STRING_TYPES = (str, unicode) # Python 2.
+except NameError:
+    _STRING_TYPES = (str,)
+
+# magic, version, header size, num_assays, num_chambers, sim_targets,
+# assay words, chamber words, then the offsets of the names, chambers,
+# reserved sets, occupancy and dont-mix sections, the file size, and the
+# CRC-32.
+_HEADER = struct.Struct('<4sHHIIIII6QI4x')
+
+
+class AllocationFile:
+    """
+    An allocation held in the binary format. Read-only.
+    """
+
+    def __init__(self, data, verify=False):
+        """
+        Provide the contents of an allocation file, as bytes or anything else
+        that supports the buffer protocol (such as an mmap). Raises
+        ValueError if it is not a valid allocation file. If verify is True,
+        the CRC-32 is checked as well, which reads every byte.
+        """
+        self._data = memoryview(data)
+        if len(self._data) < _HEADER.size:
+            raise ValueError('Too short to be an allocation file')
+        (magic, version, header_size, num_assays, num_chambers, sim_targets,
+                self._assay_words, self._chamber_words, names_at, chambers_at,
+                self._reserved_at, self._occupancy_at, self._dont_mix_at,
+                size, crc) = _HEADER.unpack_from(self._data, 0)
+        if magic != _MAGIC:
+            raise ValueError('Not an allocation file')
+        if version != FORMAT_VERSION:
+            raise ValueError('Unsupported allocation file version: %d' %
+                    version)
+        if size != len(self._data):
+            raise ValueError('Allocation file is truncated')
+        if verify and zlib.crc32(self._data[header_size:]) & 0xffffffff != \
+                crc:
+            raise ValueError('Allocation file is damaged')
+        self._file = None
+        self._mmap = None
+        self.version = version
+        self.sim_targets = sim_targets
+
+        offsets = struct.unpack_from('<%dI' % (num_assays + 1), self._data,
+                names_at)
+        text_at = names_at + 4 * (num_assays + 1)
+        text = self._data[text_at:text_at + offsets[-1]].tobytes()
+        # The assay types, in priority order.
+        self.assays = [text[offsets[i]:offsets[i + 1]].decode('utf-8') for
+                i in range(num_assays)]
+        # The chambers, in ascending order.
+        self.chambers = list(struct.unpack_from('<%di' % num_chambers,
+                self._data, chambers_at))
+        self._index_of_assay = dict((assay, index) for
+                index, assay in enumerate(self.assays))
+        self._index_of_chamber = dict((chamber, index) for
+                index, chamber in enumerate(self.chambers))
+
+
+    @classmethod
+    def open(cls, path, verify=False):
+        """
+        Memory-maps the allocation file at the given path. (Call close() when
+        finished with it.) Verify is as for the constructor.
+        """
+        f = open(path, 'rb')
+        try:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except:
+            f.close()
+            raise
+        try:
+            allocation_file = cls(mapped, verify)
+        except:
+            f.close()
+            raise
+        allocation_file._file = f
+        allocation_file._mmap = mapped
+        return allocation_file
+
+
+    @classmethod
+    def save(cls, path, experiment_design, alloc):
+        """
+        Writes the given Allocation, made for the given ExperimentDesign, to
+        an allocation file at the given path.
+        """
+        with open(path, 'wb') as f:
+            f.write(cls.encode(experiment_design, alloc))
+
+
+    @classmethod
+    def from_allocation(cls, experiment_design, alloc):
+        """
+        An AllocationFile held in memory, for the given Allocation.
+        """
+        return cls(cls.encode(experiment_design, alloc))
+
+
+    @classmethod
+    def encode(cls, experiment_design, alloc):
+        """
+        The contents of the allocation file for the given Allocation, made for
+        the given ExperimentDesign, as bytes. Only the assay types that have
+        been allocated are included. Raises ValueError if any of them is not
+        a string.
+        """
+        allocated = set(alloc.all_assays())
+        assays = [assay for assay in
+                experiment_design.assay_types_in_priority_order() if
+                assay in allocated]
+        for assay in assays:
+            if not isinstance(assay, _STRING_TYPES):
+                raise ValueError('Assay types must be strings, not: %r' %
+                        (assay,))
+        chambers = sorted(experiment_design.set_of_all_chambers())
+        index_of_chamber = dict((chamber, index) for
+                index, chamber in enumerate(chambers))
+        assay_words = (len(assays) + 63) // 64
+        chamber_words = (len(chambers) + 63) // 64
+
+        # Each row of each bit matrix as an integer bitmask, to begin with.
+        reserved = []
+        occupancy = [0] * len(chambers)
+        for index, assay in enumerate(assays):
+            row = 0
+            for chamber in alloc.chambers_for(assay):
+                row |= 1 << index_of_chamber[chamber]
+                occupancy[index_of_chamber[chamber]] |= 1 << index
+            reserved.append(row)
+        dont_mix = DontMixMasks(experiment_design)
+        position_of = dict((assay, position) for position, assay in
+                enumerate(experiment_design.assay_types_in_priority_order()))
+        partners = []
+        for assay in assays:
+            forbidden = dont_mix.forbidden_partners(assay)
+            partners.append(sum(1 << index for index, other in
+                    enumerate(assays) if forbidden >> position_of[other] & 1))
+
+        names = [assay.encode('utf-8') for assay in assays]
+        offsets = [0]
+        for name in names:
+            offsets.append(offsets[-1] + len(name))
+        sections = [
+            struct.pack('<%dI' % len(offsets), *offsets) + b''.join(names),
+            struct.pack('<%di' % len(chambers), *chambers),
+            _pack_rows(reserved, chamber_words),
+            _pack_rows(occupancy, assay_words),
+            _pack_rows(partners, assay_words),
+        ]
+        body = bytearray()
+        section_offsets = []
+        for section in sections:
+            body.extend(b'\0' * (-(_HEADER.size + len(body)) % 8))
+            section_offsets.append(_HEADER.size + len(body))
+            body.extend(section)
+        header = _HEADER.pack(_MAGIC, FORMAT_VERSION, _HEADER.size,
+                len(assays), len(chambers), experiment_design.sim_targets,
+                assay_words, chamber_words, *(section_offsets +
+                [_HEADER.size + len(body), zlib.crc32(bytes(body)) &
+                0xffffffff]))
+        return header + bytes(body)
+
+
+    def close(self):
+        """
+        Releases the memory-mapped file, if there is one. (Any arrays
+        provided by reserved_words() or occupancy_words() must have been
+        let go of first.)
+        """
+        self._data.release()
+        if self._mmap is not None:
+            self._mmap.close()
+            self._file.close()
+            self._mmap = self._file = None
+
+
+    def all_assays(self):
+        return list(self.assays)
+
+
+    def chambers_for(self, assay):
+        """
+        The chambers in the given assay type's reserved chamber set, as a
+        frozenset.
+        """
+        row = self._row(self._reserved_at, self._chamber_words,
+                self._index_of_assay[assay])
+        return frozenset(self.chambers[i] for i in _bits(row))
+
+
+    def assays_in(self, chamber):
+        """
+        The assay types in the given chamber, in priority order.
+        """
+        row = self._row(self._occupancy_at, self._assay_words,
+                self._index_of_chamber[chamber])
+        return [self.assays[j] for j in _bits(row)]
+
+
+    def forbidden_partners(self, assay):
+        """
+        The assay types that must not share a chamber with the given one, in
+        priority order.
+        """
+        row = self._row(self._dont_mix_at, self._assay_words,
+                self._index_of_assay[assay])
+        return [self.assays[j] for j in _bits(row)]
+
+
+    def reserved_words(self):
+        """
+        The reserved sets, as a NumPy array of assays x uint64 words. A view
+        of the file, not a copy.
+        """
+        return self._words(self._reserved_at, len(self.assays),
+                self._chamber_words)
+
+
+    def occupancy_words(self):
+        """
+        The occupancy, as a NumPy array of chambers x uint64 words. A view of
+        the file, not a copy.
+        """
+        return self._words(self._occupancy_at, len(self.chambers),
+                self._assay_words)
+
+
+    def to_allocation(self):
+        """
+        Provides the allocation as an Allocation.
+        """
+        alloc = Allocation()
+        for assay in self.assays:
+            alloc.allocate(assay, self.chambers_for(assay))
+        return alloc
+
+
+    #------------------------------------------------------------------------
+    # Private / implementation methods below.
+    #------------------------------------------------------------------------
+
+    def _row(self, section_at, words, index):
+        """
+        The given row of a bit matrix, as an integer bitmask.
+        """
+        row = 0
+        values = struct.unpack_from('<%dQ' % words, self._data,
+                section_at + 8 * words * index)
+        for word_index, value in enumerate(values):
+            row |= value << (64 * word_index)
+        return row
+
+
+    def _words(self, section_at, rows, words):
+        """
+        Imported here so that NumPy is only needed by those who want arrays.
+        """
+        import numpy as np
+        return np.frombuffer(self._data, dtype='<u8', count=rows * words,
+                offset=section_at).reshape(rows, words)
+
+
+def _pack_rows(rows, words):
+    """
+    Integer bitmasks -> bytes, each row as <words> little-endian uint64s.
+    """
+    packed = bytearray()
+    mask = (1 << 64) - 1
+    for row in rows:
+        packed.extend(struct.pack('<%dQ' % words, *[(row >> (64 * i)) & mask
+                for i in range(words)]))
+    return bytes(packed)
+
+
+def _bits(row):
+    """
+    The positions of the set bits of an integer bitmask, in ascending order.
+    """
+    while row:
+        lowest = row & -row
+        yield lowest.bit_length() - 1
+        row ^= lowest
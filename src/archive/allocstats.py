@@ -0,0 +1,110 @@
+"""
+Counters, timers and an optional event stream, describing the work an
+allocator did.
+
+The counters are plain integer attributes, which the allocator adds to
+directly (or, in its innermost loops, adds a local tally to once the loop is
+done), so keeping them costs next to nothing. Timing is per assay type, not
+per operation.
+
+If a file (or anything with a write() method) is given for events, one line of
+JSON is written to it for each thing of note that happens: an assay type's
+search starting and finishing, and the pool of candidates being pruned. With
+no events file, nothing is formatted or written at all.
+"""
+
+import json
+import time
+
+
+class AllocationStats:
+    """
+    The work done by one allocator.
+
+        candidates_generated    Candidate chamber sets put in priority order.
+        compatibility_rejects   Chamber sets left out because of the dont-mix
+                                rules.
+        symmetric_skips         Candidates generated but not tested because
+                                an equivalent one (up to relabelling
+                                chambers) had been.
+        vulnerability_checks    Candidates tested for vulnerability.
+        target_sets_skipped     Target sets the index let us avoid looking at.
+        all_fire_tests          Target sets given the all-firing test.
+        pool_pruned             Chamber sets pruned from the pool.
+        seconds_per_assay       Assay type -> seconds spent placing it.
+    """
+
+    COUNTERS = ('candidates_generated', 'compatibility_rejects',
+            'symmetric_skips', 'vulnerability_checks', 'target_sets_skipped',
+            'all_fire_tests', 'pool_pruned')
+
+    def __init__(self, events=None):
+        """
+        Events, if given, is where to write the JSON-lines event stream.
+        """
+        for counter in self.COUNTERS:
+            setattr(self, counter, 0)
+        self.seconds_per_assay = {}
+        self._events = events
+        self._started = None
+
+
+    def assay_started(self, assay):
+        self._started = time.time()
+        if self._events is not None:
+            self._emit('assay_started', assay=assay)
+
+
+    def assay_finished(self, assay, chamber_set):
+        """
+        Chamber_set is where the assay was placed, or None if it could not
+        be.
+        """
+        seconds = time.time() - self._started
+        self.seconds_per_assay[assay] = seconds
+        if self._events is not None:
+            chambers = None
+            if chamber_set is not None:
+                chambers = sorted(chamber_set)
+            self._emit('assay_finished', assay=assay, chambers=chambers,
+                    seconds=seconds, counters=self.counters())
+
+
+    def pruned(self, before, removed):
+        """
+        Register that <removed> of the <before> chamber sets in the pool were
+        pruned.
+        """
+        self.pool_pruned += removed
+        if self._events is not None:
+            self._emit('pool_pruned', before=before, removed=removed)
+
+
+    def counters(self):
+        """
+        The counters, as a dict.
+        """
+        return dict((counter, getattr(self, counter)) for
+                counter in self.COUNTERS)
+
+
+    def as_dict(self):
+        """
+        Everything, as a dict that can be saved as JSON.
+        """
+        stats = self.counters()
+        stats['seconds_per_assay'] = dict((str(assay), seconds) for
+                assay, seconds in self.seconds_per_assay.items())
+        return stats
+
+
+    #------------------------------------------------------------------------
+    # Private / implementation methods below.
+    #------------------------------------------------------------------------
+
+    def _emit(self, event, **fields):
+        fields['event'] = event
+        fields['time'] = time.time()
+        if 'assay' in fields:
+            fields['assay'] = str(fields['assay'])
+        self._events.write(json.dumps(fields, sort_keys=True) + '\n')
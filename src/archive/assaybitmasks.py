@@ -0,0 +1,72 @@
+"""
+A bitmask view of an allocation's chamber occupancy.
+
+Each assay type is given one bit position, so that the set of assays present
+in a chamber can be held as a single integer. A target set, likewise, becomes
+a single integer. Asking whether a chamber would fire in the presence of some
+targets then reduces to one AND operation, and asking the same question of a
+whole chamber set never has to build any intermediate sets.
+"""
+
+
+class AssayBitmasks:
+    """
+    Mirrors the chamber occupancy of an Allocation as integer bitmasks. The
+    owner is responsible for telling it about every assay it adds to the
+    Allocation it shadows.
+    """
+
+    def __init__(self, assay_types):
+        """
+        Provide the assay types that can ever be present. Each is assigned a
+        bit, in the order given.
+        """
+        self._bit_for = {}
+        for position, assay in enumerate(assay_types):
+            self._bit_for[assay] = 1 << position
+        # Chamber number -> bitmask of the assays present in that chamber.
+        self._chamber_masks = {}
+
+
+    def bit_for(self, assay):
+        """
+        The single-bit mask that represents the given assay type.
+        """
+        return self._bit_for[assay]
+
+
+    def mask_for(self, assays):
+        """
+        The bitmask that represents the given collection of assay types, for
+        example a target set {A,D,F,N}.
+        """
+        mask = 0
+        for assay in assays:
+            mask |= self._bit_for[assay]
+        return mask
+
+
+    def chamber_mask(self, chamber):
+        """
+        The bitmask of the assay types currently present in the given chamber.
+        """
+        return self._chamber_masks.get(chamber, 0)
+
+
+    def occupancy(self, chamber):
+        """
+        How many assay types are currently present in the given chamber.
+        """
+        return bin(self._chamber_masks.get(chamber, 0)).count('1')
+
+
+    def add(self, assay, chamber_set):
+        """
+        Register that the given assay has been placed in each of the chambers
+        in chamber_set.
+        """
+        bit = self._bit_for[assay]
+        masks = self._chamber_masks
+        for chamber in chamber_set:
+            masks[chamber] = masks.get(chamber, 0) | bit
+
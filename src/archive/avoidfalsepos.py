@@ -33,7 +33,9 @@ using the previous decisions (cumulatively) as constraints.
 It adopts the dynamic programming principle by building up knowledge as it
 goes about where false-positive calls have been ruled-out, and only
 re-evaluating those that could be compromised as each new assay type is mixed
-in.
+in. Specifically, a previously reserved chamber set can only have become
+vulnerable through the assay just mixed in, so it is re-checked only against
+the target sets that contain that assay.
 
 
 METHOD
@@ -103,6 +105,11 @@ The algorithm has a setting in it that makes it ignore target sets with more
 than N members. We'll call this *sim_targets*. (A pragmatic compromise, to 
 avoid very long program run-times). 
 
+The 'cover' backend avoids enumerating the target sets altogether. It instead
+searches directly for a set of at most sim_targets assays that would make all
+of a reserved chamber set fire. (A hitting set). This makes larger values of
+sim_targets tractable.
+
 The algorithm does not model any target sets smaller than this upper limit. For
 example for if we are working with sim_targets=5, a set could be {ADNPS}. We
 can safely ignore all the smaller subsets like {ADN}, or {DPS} because any
@@ -145,12 +152,46 @@ that consider all the relevant possible available within its constraints, at
 each stage. However we can deduce that large chunks of these can be skipped
 because they will not provide any new information. See the code comments to see
 where these are deployed.
+
+One of them is symmetry breaking. Chambers that hold exactly the same assay
+types are interchangeable: swapping their labels changes nothing about the
+allocation. So two candidate chamber sets that differ only by such a swap are
+equally vulnerable (or not). Within the search for one assay's home, only the
+first candidate of each such equivalence class gets tested. Because it is the
+first, any later one in the same class would have been rejected too, and so
+the allocation produced is unchanged. This saves vulnerability checks only.
+Every candidate is still generated and put in order, because the classes are
+weeded out of the ordered candidates as they go by. (Generating one
+representative of each class directly would change the order, and so the
+allocations.) The symmetric_skips counter says how many checks were saved.
+With the pool pruned as it is (see the code comments), candidates are seldom
+rejected, so in practice there is little to save.
 """
 
-from itertools import combinations
+import heapq
 
 from lib.model import Allocation
 from lib.model import PossibleTargets
+from lib.model.allocstats import AllocationStats
+from lib.model.assaybitmasks import AssayBitmasks
+from lib.model.chamberpairindex import ChamberPairIndex
+from lib.model.chambersetpool import ChamberSetPool
+from lib.model.coversearch import CoverSearch
+from lib.model.dontmixmasks import DontMixMasks
+from lib.model.feasibility import Feasibility
+from lib.model.indexedallocation import IndexedAllocation
+from lib.model.targetsetindex import TargetSetIndex
+
+
+# The ways in which the vulnerability test can be carried out.
+_BACKENDS = ('python', 'numpy', 'cover')
+
+# How many candidate chamber sets to put in order at a time. The batch size
+# grows fourfold each time a caller gets to the end of a batch, up to the
+# maximum. Only one batch of ordering keys is held at a time, so the maximum
+# bounds the memory needed, whatever the size of the pool.
+_FIRST_BATCH = 256
+_MAX_BATCH = 65536
 
 
 class AvoidsFP:     # FP = False-Positive
@@ -173,12 +214,45 @@ class AvoidsFP:     # FP = False-Positive
 
     """
 
+    # Increase this whenever a change alters the allocations produced. (It
+    # is part of the key under which AllocationCache stores them.)
+    VERSION = 1
 
-    def __init__(self, experiment_design):
+
+    def __init__(self, experiment_design, backend='python', workers=None,
+            priority_order=None, events=None, warm_cache=None):
         """
         Provide an ExperimentDesign object when initialising the allocator..
+
+        The backend chooses how the vulnerability test is carried out. Either
+        'python' (one target set at a time), 'numpy' (all the target sets
+        at once, with vectorised array operations), or 'cover' (a hitting set
+        search that never builds the target sets). All produce identical
+        allocations.
+
+        If workers is more than one, that many worker processes test
+        candidate chamber sets speculatively, in parallel. The allocation
+        produced is identical, but the tracer and the vulnerability test
+        counters in self.stats only see the work done in this process.
+
+        The assay types are allocated in the experiment design's priority
+        order, unless a different priority_order is given.
+
+        The work done is counted in self.stats (an AllocationStats). To
+        follow it as it happens, give a file to write JSON-lines events to.
+
+        A WarmCache, if given, supplies the target sets and the initial pool
+        of chamber sets when it has them from an earlier allocator (and keeps
+        them when it doesn't).
         """
+        if backend not in _BACKENDS:
+            raise ValueError('Unknown backend: %s' % backend)
         self._design = experiment_design
+        self._backend = backend
+        self._warm_cache = warm_cache
+        if priority_order is None:
+            priority_order = experiment_design.assay_types_in_priority_order()
+        self._priority_order = list(priority_order)
         # This is a diagnostics channel to support unit testing.
         # A few parts of the code send it messages to provide evidence that
         # something happened (if it is none none).
@@ -186,12 +260,52 @@ class AvoidsFP:     # FP = False-Positive
         # Prepare an Allocation object with which to register allocation
         # decisions as they progress.
         self.alloc = Allocation()
-        # Prepare the set of all possible (hypothetical) target sets to 
-        # consider during the allocation process.
-        # NB, there are circa tens-of-thousands of these if we draw from a 
-        # 20-member superset, and constrain the subsets to 5 or fewer members.
-        self._possible_target_sets = PossibleTargets.create(
-            experiment_design, experiment_design.sim_targets)
+        # The dont-mix rules, compiled into bitmasks.
+        self._dont_mix = DontMixMasks(experiment_design)
+        # Shadow the allocation's chamber occupancy as integer bitmasks, so
+        # that the all-firing test in the innermost loop needs no set
+        # operations.
+        self._masks = AssayBitmasks(
+                experiment_design.assay_types_in_priority_order())
+        # All changes to the allocation go through this, which keeps the
+        # bitmasks and some lookup indexes in step with it, and lets us ask
+        # "what if" questions without altering it.
+        self._state = IndexedAllocation(self.alloc, self._masks)
+        # Counts of the work done, and timings. (For diagnostics only.)
+        self.stats = AllocationStats(events)
+        # The placements committed so far, in order. (For bringing the
+        # speculative workers up to date.)
+        self._commits = []
+        self._workers = workers
+        self._speculator = None
+        # The vectorised alternative to the pure-Python vulnerability test,
+        # when asked for.
+        self._engine = None
+        # The hitting set search alternative, when asked for.
+        self._cover_search = None
+        if backend == 'cover':
+            # This needs no target sets at all.
+            self._possible_target_sets = None
+            self._target_sets = None
+            self._cover_search = CoverSearch(experiment_design.sim_targets,
+                    len(experiment_design.assay_types_in_priority_order()))
+        elif warm_cache is not None:
+            self._possible_target_sets, self._target_sets = \
+                    warm_cache.target_sets(experiment_design, self._masks)
+        else:
+            # Prepare the set of all possible (hypothetical) target sets to 
+            # consider during the allocation process.
+            # NB, there are circa tens-of-thousands of these if we draw from a 
+            # 20-member superset, and constrain the subsets to 5 or fewer
+            # members.
+            self._possible_target_sets = PossibleTargets.create(
+                experiment_design, experiment_design.sim_targets)
+            # The same target sets, with their bitmasks, indexed by member
+            # assay.
+            self._target_sets = TargetSetIndex(
+                    self._possible_target_sets.sets, self._masks)
+        if backend == 'numpy':
+            self._engine = self._make_numpy_engine()
         # This algorithm requires that the number of replicas that get
         # placed for each assay, be at least one greater than the largest
         # number of simultaneous targets being considered.
@@ -200,35 +314,149 @@ class AvoidsFP:     # FP = False-Positive
         # for a home of each assay's replicas. We deplete this as we go.
         self._available_chamber_sets = \
                 self._initial_set_of_available_chamber_sets(self._replicas)
+        # Lets us find the chamber sets in the pool that share a given pair
+        # of chambers, without scanning the pool.
+        self._pair_index = ChamberPairIndex(self._available_chamber_sets)
 
 
-    def allocate(self):
+    def allocate(self, existing=None):
         """
         Entry point to the allocation algorithm.
+
+        To extend an allocation made earlier (for example an established
+        panel, to which a few assay types have been added), provide it as
+        existing. Its placements are kept exactly as they are, and only the
+        assay types it lacks are searched for.
         """
 
-        # Work through the assay types in the priority order specified by
-        # the experiment design, and for each, allocate all the replicas
-        # in one go.
-        for assay_P in self._design.assay_types_in_priority_order():
-            self._allocate_all_replicas_of_this_assay_type(assay_P)
+        # Don't search at all, if there provably is nothing to find.
+        verdict = self.feasibility(self._design)
+        if verdict.ruled_out:
+            raise RuntimeError('Cannot allocate: %s' % verdict.reason)
+
+        if existing is not None:
+            self._adopt(existing)
+
+        if self._workers is not None and self._workers > 1:
+            self._speculator = self._make_speculator()
+        try:
+            # Work through the assay types in the priority order specified by
+            # the experiment design (or our caller), and for each, allocate
+            # all the replicas in one go.
+            for assay_P in self._priority_order:
+                if assay_P in self.alloc.all_assays():
+                    continue
+                self._allocate_all_replicas_of_this_assay_type(assay_P)
+        finally:
+            if self._speculator is not None:
+                self._speculator.close()
+                self._speculator = None
 
         return self.alloc
 
 
+    @classmethod
+    def feasibility(cls, experiment_design):
+        """
+        Provides a feasibility Verdict for this algorithm and the given
+        ExperimentDesign. (Without building the allocator, which can be
+        expensive.) The replicas are one more than sim_targets, and the pool
+        pruning means no two chamber sets share more than one chamber.
+        """
+        return Feasibility.from_design(experiment_design).check(
+                experiment_design.sim_targets + 1, 1)
+
+
     #------------------------------------------------------------------------
     # Private / implementation methods below.
     #------------------------------------------------------------------------
 
+    def _make_numpy_engine(self):
+        """
+        Builds the NumPy vulnerability engine. Imported here so that NumPy is
+        only required when this backend is chosen.
+        """
+        from lib.model.numpyvulnerability import NumpyVulnerabilityEngine
+        return NumpyVulnerabilityEngine(
+                self._design.assay_types_in_priority_order(),
+                self._design.set_of_all_chambers(),
+                self._possible_target_sets.sets)
+
+    def _make_speculator(self):
+        """
+        Starts the worker processes for speculative testing. Imported here
+        because most allocations do not need them.
+        """
+        from lib.model.speculation import SpeculativeChecker
+        return SpeculativeChecker(self._design, self._backend, self._workers)
+
     def _initial_set_of_available_chamber_sets(self, replicas):
         """
         Builds the initial set of chamber sets. (A set of sets), which can be 
-        consdidered to house the replicas of each assay.
+        consdidered to house the replicas of each assay. They are held as a
+        compact ChamberSetPool, rather than as frozensets, to keep memory use
+        bounded for cartridges with many chambers.
         """
         chambers = self._design.set_of_all_chambers()
-        chamber_sets = self._draw_possible_chamber_sets_of_size(
-                chambers, replicas)
-        return chamber_sets
+        if self._warm_cache is not None:
+            return self._warm_cache.chamber_set_pool(chambers, replicas)
+        return ChamberSetPool(chambers, replicas)
+
+    def _adopt(self, existing):
+        """
+        Take on the placements of an existing Allocation as if we had made
+        them ourselves. Brings the vulnerability state and the pool of
+        available chamber sets into the same state that searching for them
+        would have, without doing any of the searching.
+
+        The search relies on the allocation being invulnerable before each
+        assay is added, so the existing placements are checked as they are
+        taken on: for the dont-mix rules, for no two reserved chamber sets
+        having more than one chamber in common, and for no reserved chamber
+        set being able to all-fire without its reserving assay. Raises
+        ValueError if they fail.
+        """
+        chambers = self._design.set_of_all_chambers()
+        adopted = []
+        for assay in existing.all_assays():
+            if assay not in self._priority_order:
+                raise ValueError(
+                        'Existing allocation has unknown assay type: %s' %
+                        assay)
+            chamber_set_147 = frozenset(existing.chambers_for(assay))
+            if not chamber_set_147 <= chambers:
+                raise ValueError(
+                        'Existing allocation uses chambers not in the '
+                        'design: %s' % sorted(chamber_set_147 - chambers))
+            if not self._dont_mix.allowed(assay, chamber_set_147):
+                raise ValueError(
+                        'Existing allocation breaks the dont-mix rules for: '
+                        '%s' % assay)
+            for other, chamber_set_258 in adopted:
+                if len(chamber_set_147 & chamber_set_258) > 1:
+                    raise ValueError(
+                            'Existing allocation has %s and %s sharing more '
+                            'than one chamber' % (other, assay))
+            self._commit(assay, chamber_set_147)
+            self._ditch_available_chamber_sets_that_inevitably_wont_work(
+                    chamber_set_147)
+            adopted.append((assay, chamber_set_147))
+
+        cover_search = CoverSearch(self._design.sim_targets,
+                len(self._design.assay_types_in_priority_order()))
+        for assay, chamber_set_147 in adopted:
+            chamber_masks = [self._masks.chamber_mask(chamber) for
+                    chamber in chamber_set_147]
+            cover = cover_search.find_cover(chamber_masks,
+                    self._masks.bit_for(assay))
+            if cover is not None:
+                targets = sorted(str(other) for other in self._priority_order
+                        if cover & self._masks.bit_for(other))
+                raise ValueError(
+                        'Existing allocation is vulnerable: targets %s fire '
+                        'all the chambers reserved by %s' %
+                        (', '.join(targets), assay))
+
 
     def _allocate_all_replicas_of_this_assay_type(self, assay_P):
         """
@@ -236,41 +464,87 @@ class AvoidsFP:     # FP = False-Positive
         having previously allocated the replicas that precede assay P in
         allocation priority order.
         """
-        print('XXX allocate all of %s' % assay_P)
+        self.stats.assay_started(assay_P)
         # We have a global (diminishing) pool of available chamber sets,
         # but whilst dealing with assay_P, we must avoid those that would 
         # contravene the dont-mix rules for assay_P.
         legal_chamber_sets = \
                 self._legal_available_chamber_sets_prioritised(assay_P)
 
-        # Use the first chamber set we encounter that does not put the overall
-        # allocation into a vulnerable state. (Where it can produce false
-        # positives.)
+        chamber_set_147 = self._first_invulnerable_chamber_set(
+                assay_P, legal_chamber_sets)
+        self.stats.assay_finished(assay_P, chamber_set_147)
+
+        # If we found one, we tell our allocation object to register and
+        # reserve them thus.
+        if chamber_set_147 is not None:
+            self._commit(assay_P, chamber_set_147)
+            # We can now remove by inference some sets in our pool
+            # of available chamber sets. This has a major bearing on
+            # performance by pruning our outermost loop.
+            self._ditch_available_chamber_sets_that_inevitably_wont_work(
+                    chamber_set_147)
+            return
+
+        # If we get here, we couldn't find a suitable chamber set and have
+        # to give up and abort.
+        raise RuntimeError('Cannot allocate: %s' % assay_P)
+
+
+    def _first_invulnerable_chamber_set(self, assay_P, legal_chamber_sets):
+        """
+        Use the first chamber set we encounter that does not put the overall
+        allocation into a vulnerable state. (Where it can produce false
+        positives.) Provides None if there isn't one.
+        """
+        legal_chamber_sets = self._one_per_symmetry_class(legal_chamber_sets)
+        if self._speculator is not None:
+            # Have the workers test them, several at a time. They still find
+            # the first one.
+            found = self._speculator.first_invulnerable(
+                    self._commits, assay_P, legal_chamber_sets)
+            if found is None:
+                return None
+            position, chamber_set_147 = found
+            self.stats.vulnerability_checks += position + 1
+            return chamber_set_147
 
         for chamber_set_147 in legal_chamber_sets:
+            self.stats.vulnerability_checks += 1
             # Would adding assay_P to this chamber set make the allocation
             # as a whole  vulnerable?
             vulnerable = self._is_allocation_with_assay_P_added_vulnerable(
                 assay_P, chamber_set_147)
 
             # If it is not vulnerable, we need look no further. We've found a
-            # suitable set of chambers for assay_P, so we tell our allocation
-            # object to register and reserve them thus. 
-
+            # suitable set of chambers for assay_P.
             if not vulnerable:
-                self.alloc.allocate(assay_P, chamber_set_147)
-                # We can now remove by inference some sets in our pool
-                # of available chamber sets. This has a major bearing on
-                # performance by pruning our outermost loop.
-                self._ditch_available_chamber_sets_that_inevitably_wont_work(
-                        chamber_set_147)
-                return
+                return chamber_set_147
             # If we get to here, that chamber set is vulnerable. Never mind,
             # let's move on to the net chamber set hypothesis.
 
-        # If we get here, we couldn't find a suitable chamber set and have
-        # to give up and abort.
-        raise RuntimeError('Cannot allocate: %s' % assay_P)
+        return None
+
+
+    def _one_per_symmetry_class(self, chamber_sets):
+        """
+        Passes on only the first of the given chamber sets from each class
+        of chamber sets that are equivalent up to relabelling chambers that
+        hold the same assay types (given the current allocation). The
+        others have still been generated, but are not tested for
+        vulnerability.
+        """
+        seen = set()
+        for chamber_set_147 in chamber_sets:
+            # Each chamber is characterised by the set of assay types it
+            # holds, so the sorted occupancies identify the class.
+            signature = tuple(sorted(self._masks.chamber_mask(chamber) for
+                    chamber in chamber_set_147))
+            if signature in seen:
+                self.stats.symmetric_skips += 1
+                continue
+            seen.add(signature)
+            yield chamber_set_147
 
 
     def _legal_available_chamber_sets_prioritised(self, assay_P):
@@ -278,22 +552,113 @@ class AvoidsFP:     # FP = False-Positive
         Down-select from the global available chamber sets, those that
         don't contravene the dont-mix rules for assay_P. Then provide them
         in desirability-order.
-        """
-        sets = [cs for cs in self._available_chamber_sets if
-                self._compatible(cs, assay_P)]
-
-        def _how_crowded(chamber_set):
-            return sum([len(self.alloc.assay_types_present_in(c)) 
-                    for c in chamber_set])
 
-        def _alphabetical(chamber_set):
-            frags = ['%02d' % c for c in chamber_set]
-            frags = ''.join(frags)
-            return frags
-
-        sets = sorted(sets, key=_alphabetical)
-        sets = sorted(sets, key=_how_crowded)
-        return sets
+        This is a generator, but it is not lazy about the pool. The
+        alphabetical order follows the order in which a frozenset happens
+        to visit its chambers, so there is no way to produce the chamber
+        sets in order without looking at all of them. So each assay costs
+        time in proportion to the size of the pool, however soon the
+        caller stops.
+
+        The memory it needs is bounded by the batch size, not by the pool.
+        A first walk over the pool only counts the chamber sets at each
+        crowdedness. Then each batch is chosen by a walk of its own, which
+        works out the ordering key (packed into an integer, along with the
+        crowdedness and the rank) of just those chamber sets in the
+        crowdedness levels that the batch can reach, and keeps the smallest
+        few beyond the end of the last batch. A walk per batch is the price
+        of not storing every key: a caller that goes through all of a large
+        pool pays for a walk per _MAX_BATCH chamber sets. The order produced
+        is exactly that of sorting the whole pool by crowdedness, then
+        alphabetically.
+
+        The chambers that the dont-mix rules bar assay_P from are left out of
+        the candidates from the start, so every chamber set provided is
+        compatible.
+        """
+        pool = self._available_chamber_sets
+        excluded = self._dont_mix.forbidden_chambers(assay_P)
+        total = pool.total
+        # While every chamber is below 100, each fragment of the alphabetical
+        # key is two digits, so the key compares as the base 100 number it
+        # spells.
+        numeric = pool.chambers()[-1] < 100
+
+        crowding = {}
+        for chamber in self._design.set_of_all_chambers():
+            crowding[chamber] = self._masks.occupancy(chamber)
+
+        # The least that any pool.size - 1 chambers can add to a chamber
+        # set's crowdedness.
+        least_company = sum(sorted(crowding.values())[:pool.size - 1])
+
+        def _keys(lowest, highest, floor):
+            # The ordering keys beyond floor, of the available chamber sets
+            # whose crowdedness is from lowest to highest. Chambers too
+            # crowded to be in any of them are left out of the walk
+            # altogether.
+            too_crowded = excluded
+            for chamber, how_crowded in crowding.items():
+                if how_crowded + least_company > highest:
+                    too_crowded |= 1 << chamber
+            for rank, combination in pool.alive_combinations(too_crowded):
+                how_crowded = sum(map(crowding.__getitem__, combination))
+                if how_crowded < lowest or how_crowded > highest:
+                    continue
+                # A frozenset, to visit the chambers in the same order as
+                # the alphabetical key does.
+                if numeric:
+                    key = how_crowded
+                    for chamber in frozenset(combination):
+                        key = key * 100 + chamber
+                    key = key * total + rank
+                else:
+                    key = (how_crowded,
+                            _alphabetical(frozenset(combination)), rank)
+                if key > floor:
+                    yield key
+
+        # How many of the chamber sets at each crowdedness are yet to be
+        # provided.
+        remaining = {}
+        for rank, combination in pool.alive_combinations(excluded):
+            how_crowded = sum(map(crowding.__getitem__, combination))
+            remaining[how_crowded] = remaining.get(how_crowded, 0) + 1
+        self.stats.compatibility_rejects += len(pool) - sum(
+                remaining.values())
+
+        # (An empty tuple is less than any other.)
+        floor = -1 if numeric else ()
+        batch_size = _FIRST_BATCH
+        while remaining:
+            # The crowdedness levels that this batch can reach.
+            levels = sorted(remaining)
+            lowest = highest = levels[0]
+            reachable = 0
+            for highest in levels:
+                reachable += remaining[highest]
+                if reachable >= batch_size:
+                    break
+            keys = _keys(lowest, highest, floor)
+            if numeric:
+                batch = _smallest(batch_size, keys)
+            else:
+                batch = heapq.nsmallest(batch_size, keys)
+            if not batch:
+                break
+            self.stats.candidates_generated += len(batch)
+            for key in batch:
+                if numeric:
+                    rank = key % total
+                    how_crowded = key // total // 100 ** pool.size
+                else:
+                    how_crowded, _, rank = key
+                remaining[how_crowded] -= 1
+                if remaining[how_crowded] == 0:
+                    del remaining[how_crowded]
+                yield frozenset(pool.unrank(rank))
+            floor = batch[-1]
+            batch_size = min(batch_size * 4, _MAX_BATCH)
 
 
     def _is_allocation_with_assay_P_added_vulnerable(
@@ -308,13 +673,14 @@ class AvoidsFP:     # FP = False-Positive
         # to all-fire, other than because their reserving-assay is present
         # among the targets present.
 
-        # Temporarily, add in assay_P as instructed.
-        self.alloc.allocate(assay_P, chamber_set_for_P)
+        # Hypothetically add in assay_P as instructed. This does not alter
+        # the allocation itself.
+        tentative = self._state.tentative(assay_P, chamber_set_for_P)
 
         # Consider all the reserved chamber sets, but only those that
         # we just potentially compromised by adding P into them.
-        filtered_reserved_chamber_sets = \
-                self._filter_reserved_chamber_sets(chamber_set_for_P)
+        filtered_reserved_chamber_sets = self._filter_reserved_chamber_sets(
+                tentative, chamber_set_for_P)
 
         for reserved_chamber_set in filtered_reserved_chamber_sets:
             # Reminder about what we know about this chamber set:
@@ -325,38 +691,14 @@ class AvoidsFP:     # FP = False-Positive
             # 4) We know it wasn't vulnerable up till the point we added
             #    (P) into it.
 
-            reserving_assay = self.alloc.which_assay_reserved_this_chamber_set(
+            reserving_assay = tentative.which_assay_reserved_this_chamber_set(
                     reserved_chamber_set)
 
-            # Consider all the possible targets-present sets that could exist.
-            for target_set_ADFN in self._possible_target_sets.sets:
-
-                # Do inexpensive tests first that avoid the more expensive
-                # all-firing test.
-
-                # If the reserving assay's target is in the possible target set,
-                # then, then it's ok (intended) that all of the chambers fire.
-                if reserving_assay in target_set_ADFN:
-                    self._trace('Can avoid all firing test for %s' % 
-                            target_set_ADFN) 
-                    continue # Skip to next target set.
-
-                # Now we've reached the more expensive test.
-                all_fire = self._all_would_fire(reserved_chamber_set, 
-                        reserving_assay, target_set_ADFN)
-                if all_fire:
-                    # The allocation as a whole is vulnerable, but before
-                    # we return, let's leave things as we found them.
-                    print('AAAAAAAAAAAA')
-                    """
-                    print('XXXX we found a vulnerability, with %s and %s' % 
-                        (target_set_ADFN, reserved_chamber_set))
-                    """
-                    self.alloc.unreserve_alloc_for(assay_P)
-                    return True # Is vulnerable.
-
-                # Good, this this target set w.r.t. this chamber set is
-                # does not make the allocation vulnerable.
+            if self._reserved_chamber_set_is_vulnerable(
+                    tentative, reserved_chamber_set, reserving_assay):
+                # The allocation as a whole is vulnerable.
+                tentative.discard()
+                return True # Is vulnerable.
 
             # Good this, chamber set does not make the allocation vulnerable,
             # across all target sets.
@@ -365,70 +707,104 @@ class AvoidsFP:     # FP = False-Positive
         # vulnerable.
 
         # Leave things as we found them.
-        self.alloc.unreserve_alloc_for(assay_P)
+        tentative.discard()
 
         # And report back that the allocation as a whole is not vulnerable.
         return False
 
 
-    def _filter_reserved_chamber_sets(self, filtering_chamber_set):
+    def _reserved_chamber_set_is_vulnerable(
+            self, tentative, reserved_chamber_set, reserving_assay):
+        """
+        Is there any possible targets-present set that would make all of the
+        given reserved chamber set fire, despite its reserving assay not being
+        present? The question is asked of the given TentativeAllocation, in
+        which assay_P has just been added. Delegates to the vectorised engine,
+        if one was chosen.
+        """
+        assay_P = tentative.assay
+        if self._engine is not None:
+            return self._engine.is_vulnerable(
+                    reserved_chamber_set, reserving_assay, tentative)
+
+        reserving_bit = self._masks.bit_for(reserving_assay)
+
+        if self._cover_search is not None:
+            # As below, a previously reserved chamber set can only have been
+            # compromised with P's help.
+            required_bit = 0
+            if reserving_assay != assay_P:
+                required_bit = self._masks.bit_for(assay_P)
+            chamber_masks = [tentative.chamber_mask(chamber) for
+                    chamber in reserved_chamber_set]
+            return self._cover_search.is_vulnerable(
+                    chamber_masks, reserving_bit, required_bit)
+
+        if reserving_assay == assay_P:
+            # This is P's own chamber set. Nothing is known about it yet, so
+            # all the possible targets-present sets must be considered.
+            target_sets = self._target_sets.entries
+        else:
+            # This chamber set was not vulnerable before P was added. So any
+            # targets-present set that now makes it all-fire must include P.
+            target_sets = self._target_sets.containing(assay_P)
+        self.stats.target_sets_skipped += \
+                len(self._target_sets) - len(target_sets)
+
+        # Consider the possible targets-present sets that could matter.
+        # (Counting all-firing tests locally, to keep this loop tight.)
+        all_fire_tests = 0
+        for target_set_ADFN, target_mask_ADFN in target_sets:
+
+            # Do inexpensive tests first that avoid the more expensive
+            # all-firing test.
+
+            # If the reserving assay's target is in the possible target set,
+            # then, then it's ok (intended) that all of the chambers fire.
+            if target_mask_ADFN & reserving_bit:
+                self._trace('Can avoid all firing test for %s',
+                        target_set_ADFN)
+                continue # Skip to next target set.
+
+            # Now we've reached the more expensive test.
+            all_fire_tests += 1
+            all_fire = self._all_would_fire(tentative, reserved_chamber_set,
+                    reserving_assay, target_mask_ADFN)
+            if all_fire:
+                self.stats.all_fire_tests += all_fire_tests
+                return True
+
+            # Good, this this target set w.r.t. this chamber set is
+            # does not make the allocation vulnerable.
+
+        self.stats.all_fire_tests += all_fire_tests
+        return False
+
+
+    def _filter_reserved_chamber_sets(self, tentative, filtering_chamber_set):
         """
-        Provide those of the reserved chamber sets that the allocation has
-        comitted to, that have members in common with the cited filtering
-        chamber set.
+        Provide those of the reserved chamber sets that the (tentative)
+        allocation has comitted to, that have members in common with the
+        cited filtering chamber set. Uses the chamber index, rather than
+        scanning every reserved chamber set.
         """
-        chamber_sets = set()
-        for chamber_set in self.alloc.reserved_chamber_sets():
-            if chamber_set.intersection(filtering_chamber_set):
-                chamber_sets.add(chamber_set)
-        return chamber_sets
+        return tentative.reserved_chamber_sets_touching(filtering_chamber_set)
 
 
-    def _all_would_fire(
-            self, chamber_set_147, reserving_assay, target_set_ADFN):
+    def _all_would_fire(self, tentative, chamber_set_147, reserving_assay,
+            target_mask_ADFN):
         """
         We are given a reserved chamber set, and the assay that reserved it.
-        The caller guarantees that the reserving assay is not already present
-        somewhere in this chamber set.
-        We are also given a potential targets-present set.
+        The caller guarantees that the reserving assay is not a member of the
+        target set.
+        We are also given a potential targets-present set, as a bitmask.
         Would the presence of the targets {A,D,F,N} cause all of the chambers
         {1,4,7} to fire - thus proving that the chamber set is vulnerable to 
         calling a false positive?
         """
-        # Trivial shortcut answer, when the 
-        for chamber in chamber_set_147:
-            occupants = self.alloc.assay_types_present_in(chamber)
-            # Only needs one chamber to have no occupants in common
-            # with the target set to conclude False.
-            if len(occupants.intersection(target_set_ADFN)) == 0:
-                return False
-        return True
+        # One AND per chamber, with no temporary sets.
+        return tentative.all_would_fire(chamber_set_147, target_mask_ADFN)
 
-    def _compatible(self, chamber_set, assay_P):
-        """
-        Is the given chamber set compatible with assay_P being added, to all
-        of its members - on the basis of assays that must not be mixed.
-        """
-        for chamber in chamber_set:
-            occupants = self.alloc.assay_types_present_in(chamber)
-            legal = self._design.can_this_assay_go_into_this_mixture(
-                assay_P, occupants)
-            if not legal:
-                return False
-        return True
-
-
-    def _draw_possible_chamber_sets_of_size(self, chambers, size):
-        """
-        Provide all the chamber subsets of size <size> that are available 
-        from the set given. Returns the collection of subsets as a sorted 
-        sequence for two reasons. Firstly to place desirable choices nearer
-        the beginning, and secondly to make the algorithm deterministic to help
-        with automated testing.
-        """
-        subsets = set()
-        [subsets.add(frozenset(c)) for c in combinations(chambers, size)]
-        return subsets
 
     def _ditch_available_chamber_sets_that_inevitably_wont_work(
             self, chamber_set_147):
@@ -447,21 +823,63 @@ class AvoidsFP:     # FP = False-Positive
         # inevitable that a possible pair of targets exist, that includes P, 
         # and the one other member will cause the remaining chamber to fire. 
         # Thus producing a false positive for P.
+        #
+        # Every such chamber set contains at least one of the pairs of
+        # chambers in {1,4,7}, so the pair index can find them all for us.
         
         before = len(self._available_chamber_sets)
-        self._available_chamber_sets = [cs for cs in
-                self._available_chamber_sets if
-                len(cs.intersection(chamber_set_147)) <= 1]
+        self._pair_index.discard_sharing_a_pair_with(chamber_set_147)
         after = len(self._available_chamber_sets)
-        print('XXX before %d, removed %d' % (before, after - before))
+        self.stats.pruned(before, before - after)
 
 
-    def _trace(self, msg):
+    def _commit(self, assay_P, chamber_set_147):
+        """
+        Place assay_P in chamber_set_147 for real, and reserve it. Keeps
+        everything that shadows the allocation in step.
+        """
+        self._state.commit(assay_P, chamber_set_147)
+        self._commits.append((assay_P, chamber_set_147))
+        self._dont_mix.place(assay_P, chamber_set_147)
+        if self._engine is not None:
+            self._engine.add(assay_P, chamber_set_147)
+
+
+    def _trace(self, msg, *args):
         """
         A convenience method that emits the given message to the listener
         that has been registered at self.tracer, if one has been registered.
-        Intended for unit test clients.
+        Intended for unit test clients. Any args are %-formatted into the
+        message, but only if there is a listener, so that tracing costs
+        nothing when nobody is listening.
         """
         if self.tracer is None:
             return
+        if args:
+            msg = msg % args
         self.tracer.trace(msg)
+
+
+def _alphabetical(chamber_set):
+    frags = ['%02d' % c for c in chamber_set]
+    frags = ''.join(frags)
+    return frags
+
+
+def _smallest(n, keys):
+    """
+    The n smallest of the given integer keys, in ascending order. As
+    heapq.nsmallest(), but without pairing each key with its position, so
+    that the n keys are all that is held.
+    """
+    # Negated, so that the largest key kept is at the top of the heap.
+    heap = []
+    for key in keys:
+        if len(heap) < n:
+            heapq.heappush(heap, -key)
+        elif -key > heap[0]:
+            heapq.heapreplace(heap, -key)
+    heap.sort(reverse=True)
+    for index, key in enumerate(heap):
+        heap[index] = -key
+    return heap
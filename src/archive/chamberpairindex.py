@@ -0,0 +1,58 @@
+"""
+An inverted index from pairs of chambers to the candidate chamber sets that
+contain both of them.
+
+Once a chamber set has been reserved, every candidate that shares two or more
+chambers with it must be removed from the pool. Those candidates are exactly
+the members of the buckets for the C(r,2) chamber pairs within the reserved
+set. So removing them never costs in proportion to the size of the whole pool.
+
+The buckets are not stored. The ranks of the chamber sets that contain a
+given pair are enumerated directly by the pool, which builds them up
+incrementally with its own ranking arithmetic. So the index costs no memory,
+and it is always consistent with the ChamberSetPool it serves.
+
+Nor does removing a bucket cost a step for each of its members. The chamber
+sets that share their first few chambers have consecutive ranks, so the pool
+can tell from the bytes that hold their bits when none of them is still
+available, and pass over them all without enumerating them. Once earlier
+reservations have removed most of a bucket, removing it costs roughly in
+proportion to what is still available among the chamber sets it shares
+leading chambers with, rather than in proportion to the bucket's size.
+"""
+
+from itertools import combinations
+
+
+class ChamberPairIndex:
+    """
+    Indexes the chamber sets of a ChamberSetPool by the chamber pairs they
+    contain.
+    """
+
+    def __init__(self, pool):
+        """
+        Provide the ChamberSetPool to index.
+        """
+        self._pool = pool
+
+
+    def ranks_containing(self, chamber_a, chamber_b):
+        """
+        Provide the ranks of all the chamber sets (available or not) that
+        include both of the given chambers.
+        """
+        return self._pool.ranks_including((chamber_a, chamber_b))
+
+
+    def discard_sharing_a_pair_with(self, chamber_set_147):
+        """
+        Remove from the pool every chamber set that has two or more chambers
+        in common with the one given. Returns how many were removed.
+        """
+        removed = 0
+        if self._pool.size < 2:
+            return removed
+        for pair in combinations(sorted(chamber_set_147), 2):
+            removed += self._pool.discard_including(pair)
+        return removed
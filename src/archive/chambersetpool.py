@@ -0,0 +1,356 @@
+"""
+A compact pool of candidate chamber sets.
+
+Holding every candidate chamber set as a frozenset costs gigabytes once the
+cartridge has 40 or more chambers. (There are 3.8 million 6-chamber subsets of
+40 chambers.) This pool holds none of them. Instead each chamber set of the
+given size is identified by its *rank*: its position in the lexicographic
+order in which itertools.combinations produces them. The pool keeps one bit
+per rank, to say whether that chamber set is still available, and unranks
+chamber sets on the fly as they are needed.
+
+So for 40 chambers and 6 replicas, the whole pool costs under half a megabyte,
+and removing a chamber set from it is just clearing a bit.
+"""
+
+from itertools import combinations
+
+
+class ChamberSetPool:
+    """
+    The set of chamber sets of one size, drawn from a given set of chambers,
+    that are still available. Starts full.
+    """
+
+    def __init__(self, chambers, size):
+        """
+        Provide the chambers to draw from, and the size of the chamber sets.
+        """
+        self._chambers = sorted(chambers)
+        self._position_of = {}
+        for position, chamber in enumerate(self._chambers):
+            self._position_of[chamber] = position
+        self._size = size
+        num_chambers = len(self._chambers)
+        # self._binomials[n][k] is n-choose-k, for the (un)ranking
+        # arithmetic.
+        self._binomials = [[_binomial(n, k) for k in range(size + 1)] for
+                n in range(num_chambers + 1)]
+        self._total = self._binomials[num_chambers][size]
+        # One bit per rank. Set means still available.
+        self._alive = bytearray(b'\xff') * ((self._total + 7) // 8)
+        spare_bits = len(self._alive) * 8 - self._total
+        if spare_bits:
+            self._alive[-1] = 0xff >> spare_bits
+        self._alive_count = self._total
+
+
+    def __len__(self):
+        return self._alive_count
+
+
+    def __iter__(self):
+        """
+        Provide the available chamber sets, as frozensets, in rank order.
+        """
+        for rank, combination in self.alive_combinations():
+            yield frozenset(combination)
+
+
+    def __contains__(self, chamber_set):
+        return self.is_alive(self.rank(chamber_set))
+
+
+    def chambers(self):
+        """
+        The chambers that the chamber sets are drawn from, in ascending order.
+        """
+        return list(self._chambers)
+
+
+    @property
+    def size(self):
+        """
+        The number of chambers in each chamber set.
+        """
+        return self._size
+
+
+    @property
+    def total(self):
+        """
+        The number of chamber sets the pool started with. (Ranks are below
+        this.)
+        """
+        return self._total
+
+
+    def alive_combinations(self, excluded_chambers=0):
+        """
+        Provide (rank, combination) pairs for the available chamber sets, in
+        rank order. Each combination is a tuple of chambers in ascending
+        order, exactly as itertools.combinations would produce it.
+
+        Optionally, chamber sets that use any of the chambers in the
+        excluded_chambers bitmask (bit <c> for chamber <c>) are left out
+        without being visited at all.
+        """
+        alive = self._alive
+        if not excluded_chambers:
+            for rank, combination in enumerate(
+                    combinations(self._chambers, self._size)):
+                if alive[rank >> 3] & (1 << (rank & 7)):
+                    yield rank, combination
+            return
+
+        # Draw only from the chambers that remain. Their combinations come
+        # out in ascending rank order too.
+        allowed = [c for c in self._chambers if
+                not excluded_chambers & (1 << c)]
+        position_of = self._position_of
+        for combination in combinations(allowed, self._size):
+            rank = self._rank_of_positions(
+                    [position_of[c] for c in combination])
+            if alive[rank >> 3] & (1 << (rank & 7)):
+                yield rank, combination
+
+
+    def copy(self):
+        """
+        Provide an independent pool, with the same chamber sets available.
+        (Much quicker than building one afresh.)
+        """
+        other = ChamberSetPool.__new__(ChamberSetPool)
+        other._chambers = self._chambers
+        other._position_of = self._position_of
+        other._size = self._size
+        # Never altered, so can be shared.
+        other._binomials = self._binomials
+        other._total = self._total
+        other._alive = bytearray(self._alive)
+        other._alive_count = self._alive_count
+        return other
+
+
+    def is_alive(self, rank):
+        return bool(self._alive[rank >> 3] & (1 << (rank & 7)))
+
+
+    def rank(self, chamber_set):
+        """
+        The rank of the given chamber set.
+        """
+        positions = sorted(self._position_of[c] for c in chamber_set)
+        return self._rank_of_positions(positions)
+
+
+    def unrank(self, rank):
+        """
+        The chamber set (as an ascending tuple) that has the given rank.
+        """
+        binomials = self._binomials
+        num_chambers = len(self._chambers)
+        size = self._size
+        combination = []
+        position = 0
+        for index in range(size):
+            while True:
+                # How many combinations put this position in this index.
+                count = binomials[num_chambers - 1 - position][
+                        size - 1 - index]
+                if rank < count:
+                    break
+                rank -= count
+                position += 1
+            combination.append(self._chambers[position])
+            position += 1
+        return tuple(combination)
+
+
+    def ranks_including(self, chambers):
+        """
+        Provide the ranks of all the chamber sets (available or not) that
+        include all of the given chambers, in ascending order.
+        """
+        for first, count in self._runs_including(chambers, False):
+            for rank in range(first, first + count):
+                yield rank
+
+
+    def discard(self, chamber_set):
+        """
+        Make the given chamber set unavailable. Returns True if it was
+        available up till now.
+        """
+        return self.discard_rank(self.rank(chamber_set))
+
+
+    def discard_rank(self, rank):
+        """
+        As discard(), but identifying the chamber set by its rank.
+        """
+        byte = rank >> 3
+        bit = 1 << (rank & 7)
+        if not self._alive[byte] & bit:
+            return False
+        self._alive[byte] &= ~bit & 0xff
+        self._alive_count -= 1
+        return True
+
+
+    def discard_including(self, chambers):
+        """
+        Make unavailable every chamber set that includes all of the given
+        chambers. Returns how many were available up till now.
+
+        The cost follows what is still available, not how many chamber sets
+        include the chambers. Those sharing the same first few chambers have
+        consecutive ranks, so a glance at the bytes that hold them shows if
+        any are still available, and if none are, they are passed over
+        without being enumerated.
+        """
+        removed = 0
+        for first, count in self._runs_including(chambers, True):
+            removed += self._discard_run(first, count)
+        return removed
+
+
+    def discard_where(self, predicate):
+        """
+        Make unavailable every available chamber set whose combination (see
+        alive_combinations()) satisfies the given predicate. Returns how many
+        were removed.
+        """
+        removed = 0
+        for rank, combination in self.alive_combinations():
+            if predicate(combination):
+                self.discard_rank(rank)
+                removed += 1
+        return removed
+
+
+    #------------------------------------------------------------------------
+    # Private / implementation methods below.
+    #------------------------------------------------------------------------
+
+    def _runs_including(self, chambers, skip_unavailable):
+        """
+        Provide the ranks of all the chamber sets that include all of the
+        given chambers, in ascending order, as runs of consecutive ranks.
+        Each is a (first_rank, count) pair. (The chamber sets that differ
+        only in their last chamber have consecutive ranks.) The runs are
+        built up a chamber at a time as the combinations are enumerated,
+        rather than being worked out afresh. If skip_unavailable is True,
+        runs may be left out when none of their chamber sets is available.
+        """
+        required = sorted(self._position_of[c] for c in chambers)
+        binomials = self._binomials
+        num_chambers = len(self._chambers)
+        size = self._size
+        last = self._total - 1
+        alive = self._alive
+        if len(required) > size:
+            return
+
+        def _extend(index, start, after, next_required):
+            # Choose the position at this index, from start onwards, but
+            # not skipping the next required position. (The ranking
+            # arithmetic is as in _rank_of_positions.)
+            still_required = len(required) - next_required
+            if index == size - 1:
+                # Each position gives the rank one more than the one
+                # before, so they make a single run.
+                if still_required == 0:
+                    first, final = start, num_chambers - 1
+                elif still_required == 1:
+                    first = final = required[next_required]
+                else:
+                    return
+                if first <= final:
+                    yield (last - after - (num_chambers - 1 - first),
+                            final - first + 1)
+                return
+            if next_required < len(required):
+                stop = required[next_required]
+            else:
+                stop = num_chambers - (size - index)
+            stop = min(stop, num_chambers - (size - index))
+            for position in range(start, stop + 1):
+                taken = next_required
+                if taken < len(required) and position == required[taken]:
+                    taken += 1
+                elif size - index - 1 < still_required:
+                    # No room left for the required positions.
+                    continue
+                term = after + binomials[num_chambers - 1 - position][
+                        size - index]
+                if skip_unavailable:
+                    # The chamber sets that start this way have the ranks
+                    # from lowest to highest.
+                    highest = last - term
+                    lowest = highest - binomials[
+                            num_chambers - 1 - position][size - 1 - index] + 1
+                    if _none_set(alive, lowest, highest):
+                        continue
+                for run in _extend(index + 1, position + 1, term, taken):
+                    yield run
+
+        if size == 0:
+            yield last, 1
+            return
+        for run in _extend(0, 0, 0, 0):
+            yield run
+
+
+    def _discard_run(self, first, count):
+        """
+        Make unavailable the chamber sets whose ranks are first to
+        first + count - 1. Returns how many of them were available up till
+        now.
+        """
+        if _none_set(self._alive, first, first + count - 1):
+            return 0
+        removed = 0
+        for rank in range(first, first + count):
+            if self.discard_rank(rank):
+                removed += 1
+        return removed
+
+
+    def _rank_of_positions(self, positions):
+        """
+        The lexicographic rank of the combination whose members are at the
+        given (ascending) positions in self._chambers.
+        """
+        binomials = self._binomials
+        num_chambers = len(self._chambers)
+        size = self._size
+        # Counting down from the last combination: the combinations that come
+        # after this one are those that are ranked higher at some index.
+        after = 0
+        for index, position in enumerate(positions):
+            after += binomials[num_chambers - 1 - position][size - index]
+        return self._total - 1 - after
+
+
+def _none_set(alive, lowest, highest):
+    """
+    Are none of the bits for the ranks from lowest to highest set in the
+    given bitmap? (Looks at whole bytes, so a bit set nearby, outside the
+    ranks, can make it say no.)
+    """
+    low_byte = lowest >> 3
+    high_byte = (highest >> 3) + 1
+    return alive.count(b'\0', low_byte, high_byte) == high_byte - low_byte
+
+
+def _binomial(n, k):
+    """
+    n-choose-k, in exact integer arithmetic.
+    """
+    if k < 0 or k > n:
+        return 0
+    result = 1
+    for i in range(min(k, n - k)):
+        result = result * (n - i) // (i + 1)
+    return result
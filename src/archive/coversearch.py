@@ -0,0 +1,130 @@
+"""
+A vulnerability test for a reserved chamber set that does not enumerate the
+possible target sets at all.
+
+Asking whether some target set of up to sim_targets assays, excluding the
+reserving assay (F), would make every chamber of F's reserved set fire, is the
+same as asking whether the occupants of those chambers (less F) have a
+*hitting set* of at most sim_targets assays. That is, a choice of assays that
+includes at least one occupant from every chamber.
+
+This module searches for such a hitting set depth-first. At each step it
+branches on the occupants of the chamber that has the fewest of them (the
+most constrained), and it abandons a branch as soon as the remaining budget
+of assays cannot possibly reach the chambers still to be hit. The cost
+depends on the occupancy of the handful of chambers involved, rather than on
+the number of possible target sets, which grows factorially with sim_targets.
+
+Occupancies are given as assay bitmasks, as provided by AssayBitmasks.
+"""
+
+
+class CoverSearch:
+    """
+    Decides whether a reserved chamber set could all-fire without its
+    reserving assay, by searching for a small hitting set.
+    """
+
+    def __init__(self, sim_targets, num_assays):
+        """
+        Provide the largest number of simultaneous targets to protect against,
+        and the number of assay types in the experiment.
+        """
+        self._sim_targets = sim_targets
+        # The possible target sets all have exactly sim_targets members. A
+        # smaller hitting set can always be padded out to that size with
+        # other assays, unless there are not enough assays other than the
+        # reserving assay to do so. In which case there is no possible target
+        # set at all to worry about.
+        self._can_pad = num_assays - 1 >= sim_targets
+
+
+    def is_vulnerable(self, chamber_masks, reserving_bit, required_bit=0):
+        """
+        Chamber_masks are the occupancy bitmasks of the chambers in a reserved
+        chamber set, and reserving_bit is the bit of the assay that reserved
+        it. If required_bit is given, only hitting sets that include that
+        assay are of interest. (Typically the assay just added.)
+        """
+        return self.find_cover(
+                chamber_masks, reserving_bit, required_bit) is not None
+
+
+    def find_cover(self, chamber_masks, reserving_bit, required_bit=0):
+        """
+        As is_vulnerable(), but provides the bitmask of a hitting set that
+        proves the vulnerability, or None when there is no such set.
+        """
+        if not self._can_pad:
+            return None
+        budget = self._sim_targets
+        if required_bit:
+            budget -= 1
+        keep = ~reserving_bit
+        masks = [mask & keep for mask in chamber_masks if
+                not mask & required_bit]
+        return _search(masks, budget, required_bit)
+
+
+#------------------------------------------------------------------------
+# Private / implementation functions below.
+#------------------------------------------------------------------------
+
+def _search(masks, budget, chosen):
+    """
+    Provide a bitmask of at most <budget> further assays that, added to
+    <chosen>, hits every one of the chamber occupancy masks given. Or None if
+    there isn't one.
+    """
+    if not masks:
+        return chosen
+    # The most constrained chamber is the one with the fewest occupants that
+    # could make it fire.
+    pivot = min(masks, key=_popcount)
+    if not pivot:
+        return None # Nothing can make this chamber fire.
+    if len(masks) <= budget:
+        # Every chamber can be given an assay of its own.
+        for mask in masks:
+            chosen |= mask & -mask
+        return chosen
+    if budget == 0:
+        return None
+    if len(masks) > budget * _most_hit_by_one_assay(masks):
+        return None # Budget cannot reach all the chambers that remain.
+
+    # Branch on each of the pivot chamber's occupants in turn.
+    candidates = pivot
+    while candidates:
+        bit = candidates & -candidates
+        candidates ^= bit
+        remaining = [mask for mask in masks if not mask & bit]
+        found = _search(remaining, budget - 1, chosen | bit)
+        if found is not None:
+            return found
+    return None
+
+
+def _most_hit_by_one_assay(masks):
+    """
+    The largest number of the given chambers that any single assay is present
+    in.
+    """
+    union = 0
+    for mask in masks:
+        union |= mask
+    most = 0
+    while union:
+        bit = union & -union
+        union ^= bit
+        hits = 0
+        for mask in masks:
+            if mask & bit:
+                hits += 1
+        if hits > most:
+            most = hits
+    return most
+
+
+def _popcount(mask):
+    return bin(mask).count('1')
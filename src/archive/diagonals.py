@@ -29,9 +29,25 @@ Exploiting Patterns
 - The pattern means we can put to one side what has been said before and
   explore an arithmetic way to generate just the first row, based on the
   experiment parameters.
+- It also means that how many chambers two rows have in common depends only
+  on how far apart they are. So whether a first row keeps the rows different
+  enough can be decided from the first row alone, and when the usual one
+  won't do, others can be searched for quickly. (See diagonaltemplates.py.)
+- Keeping the rows different enough is necessary but not sufficient to
+  prevent false positives. So the allocation each template produces is
+  certified (see fpcertifier.py), and only one that passes is used.
 """
 
 from lib.model import Allocation
+from lib.model.diagonaltemplates import DiagonalTemplates
+from lib.model.dontmixmasks import DontMixMasks
+from lib.model.feasibility import Feasibility
+from lib.model.fpcertifier import FalsePositiveCertifier
+
+
+# How many templates to try, at most, before giving up. (Each is certified,
+# which takes much longer than finding it.)
+_MAX_TEMPLATES = 64
 
 
 class DiagonalsAllocator:
@@ -41,6 +57,9 @@ class DiagonalsAllocator:
     heuristic for allocation.
     """
 
+    # Part of the AllocationCache key. Increase it if the allocations change.
+    VERSION = 2
+
 
     def __init__(self, experiment_design):
         """
@@ -50,49 +69,82 @@ class DiagonalsAllocator:
         # Prepare an Allocation object with which to register allocation
         # decisions as they progress.
         self.alloc = Allocation()
+        # The dont-mix rules, compiled into bitmasks.
+        self._dont_mix = DontMixMasks(experiment_design)
         # The N+3 relation below is a logical necessisity. See external
         # reasoning.
         self._replicas = experiment_design.sim_targets + 3
+        # No two assays' chamber sets may have more than this many chambers in
+        # common.
+        self._max_overlap = experiment_design.sim_targets - 1
+        self._templates = DiagonalTemplates(
+                len(experiment_design.assay_types),
+                experiment_design.num_chambers, self._replicas,
+                self._max_overlap, self._dont_mix_differences())
+        # The (zero-based) template used, once allocate() has succeeded.
+        self.first_row_template = None
 
 
     def allocate(self):
         """
         Entry point to the allocation algorithm.
         """
-        first_row_template = self._compute_chambers_for_first_assay()
-        self._allocate_all_assays(first_row_template)
-
-        return self.alloc
+        verdict = self.feasibility(self._design)
+        if verdict.ruled_out:
+            raise RuntimeError('Cannot allocate: %s' % verdict.reason)
+        # Use the first valid template whose allocation is free of false
+        # positives. (Usually the first one tried.)
+        certifier = FalsePositiveCertifier(self._design.sim_targets,
+                workers=1)
+        for tried, first_row_template in enumerate(
+                self._templates.valid_templates()):
+            if tried == _MAX_TEMPLATES:
+                break
+            if tried:
+                # Start afresh, after an allocation that didn't certify.
+                self.alloc = Allocation()
+                self._dont_mix = DontMixMasks(self._design)
+            self._allocate_all_assays(first_row_template)
+            if certifier.certify(self.alloc).certified:
+                self.first_row_template = first_row_template
+                return self.alloc
+        raise RuntimeError(_NO_TEMPLATE % (self._replicas,
+                self._design.num_chambers, self._max_overlap))
+
+
+    @classmethod
+    def feasibility(cls, experiment_design):
+        """
+        Provides a feasibility Verdict for this algorithm and the given
+        ExperimentDesign. Whether it succeeds is decided only by the
+        limit of sim_targets - 1 chambers in common between chamber sets, so
+        the information bound is not a necessary condition for it.
+        """
+        sim_targets = experiment_design.sim_targets
+        return Feasibility.from_design(experiment_design).check(
+                sim_targets + 3, sim_targets - 1, avoids_false_positives=False)
 
 
     #------------------------------------------------------------------------
     # Private / implementation methods below.
     #------------------------------------------------------------------------
 
-    def _compute_chambers_for_first_assay(self):
-        chambers = []
-        num_assays = len(self._design.assay_types)
-        num_chambers = self._design.num_chambers
-        # We do these calcs with zero-based chamber indices to match
-        # Arthur's doc.
-        for replica in range(self._replicas):
-            chamber = (num_assays * replica) % num_chambers
-            # If this is a diagonal we already used, move to the next
-            # unused diagonal.
-            if chamber in chambers:
-                chamber = self._next_unused(chamber, chambers)
-            chambers.append(chamber)
-        return chambers
-
-
-    def _next_unused(self, chamber, chambers):
-        # We get (num_chambers -1) bites at this cherry.
-        num_chambers = self._design.num_chambers
-        for count in range(num_chambers - 1):
-            new_chamber = (chamber + 1 + count) % num_chambers
-            if new_chamber not in chambers: # Diagonal not yet used.
-                return new_chamber
-        raise RuntimeError('No unused diagonals left')
+    def _dont_mix_differences(self):
+        """
+        Assay i (in priority order) gets the template shifted by i. So a
+        dont-mix pair of assays i and j share a chamber exactly when j - i is
+        one of the template's differences.
+        """
+        differences = set()
+        assays = self._design.assay_types_in_priority_order()
+        for i, assay in enumerate(assays):
+            # Bit j of the partners mask is the assay in position j.
+            partners = self._dont_mix.forbidden_partners(assay)
+            while partners:
+                bit = partners & -partners
+                partners ^= bit
+                differences.add(bit.bit_length() - 1 - i)
+        return differences
 
 
     def _allocate_all_assays(self, first_row_template):
@@ -112,30 +164,27 @@ class DiagonalsAllocator:
         # Flip to one-based chamber numbers at last minute.
         chamber_set = [c + 1 for c in chambers]
         chamber_set = frozenset(chamber_set)
-        self._assert_sufficiently_different_from_previous_sets(
-                assay, chamber_set)
+        self._assert_allowed_to_mix(assay, chamber_set)
         self.alloc.allocate(assay, chamber_set)
+        self._dont_mix.place(assay, chamber_set)
 
         # nd frozenset([1, 5, 9, 13, 17, 21]))
 
-    def _assert_sufficiently_different_from_previous_sets(
-                self, assay, incoming_chamber_set):
-        max_overlap = self._design.sim_targets - 1
-        for prev_assay in self.alloc.all_assays():
-            prev_chambers = self.alloc.chambers_for(prev_assay)
-            intersection = incoming_chamber_set.intersection(prev_chambers)
-            overlap = len(intersection)
-            if overlap > max_overlap:
-                msg = _EXCESS_OVERLAP % (assay, incoming_chamber_set,
-                    prev_chambers, prev_assay, overlap, max_overlap)
-                raise RuntimeError(msg)
+    def _assert_allowed_to_mix(self, assay, chamber_set):
+        if not self._dont_mix.allowed(assay, chamber_set):
+            msg = _DONT_MIX % (assay, chamber_set)
+            raise RuntimeError(msg)
 
 
-_EXCESS_OVERLAP = \
+_DONT_MIX = \
 """
 The allocation for <%s>, which is %s,
-is too similar to %s, which was used
-for <%s>. They have %d chambers in common, which is > the %d permitted.
-
+puts it in a chamber with an assay it must not be mixed with.
+"""
 
+_NO_TEMPLATE = \
+"""
+Cannot allocate: no first row template of %d chambers, out of %d, was found
+that keeps every pair of assays to %d or fewer chambers in common, and the
+dont-mix pairs apart, and gives an allocation free of false positives.
 """
@@ -0,0 +1,194 @@
+"""
+Fast validity testing of, and searching for, the first row templates used by
+the DiagonalsAllocator.
+
+Every row of a diagonal allocation is the first row (the template) shifted
+cyclically: row i is {(c + i) mod num_chambers, for c in the template}. So the
+number of chambers that rows i and j have in common depends only on the
+shift between them, d = j - i. It is the number of pairs of template chambers
+(a, b) with b - a = d (mod num_chambers). That is, the multiplicity of d in
+the template's *difference multiset*.
+
+The rows of num_assays assays are shifted by 0 .. num_assays-1, so the shifts
+between them are 1 .. num_assays-1. (And the same shifts backwards, which give
+the same overlaps.) So a template is valid if no difference in that range
+occurs more than max_overlap times. This can be decided from the template
+alone, in time proportional to replicas squared, regardless of the number of
+assays.
+
+Likewise, two assays that must not be mixed share a chamber exactly when the
+shift between them is one of the template's differences. So the dont-mix
+pairs translate into differences that the template must not have at all.
+
+Validity is necessary for an allocation free of false positives, but it is
+not sufficient, so the DiagonalsAllocator certifies the allocation that a
+valid template produces before using it.
+
+Templates are searched for in two stages:
+
+    Arithmetic: the template the DiagonalsAllocator has always used, with
+    replica r at chamber (stride * r), where the stride is num_assays. Then
+    the same for other strides, nearest to num_assays first. (A collision
+    moves on to the next unused chamber, as it always has.)
+
+    Depth first: templates built up one chamber at a time, rejecting any
+    chamber that would make some difference occur too often. Like
+    constructing a Golomb ruler. This gives up after a fixed amount of work.
+
+Chamber numbers here are zero-based.
+"""
+
+
+# How many partial templates the depth first search may consider.
+_SEARCH_BUDGET = 20000
+
+
+class DiagonalTemplates:
+    """
+    Validity testing and searching, for the templates of one experiment's
+    dimensions.
+    """
+
+    def __init__(self, num_assays, num_chambers, replicas, max_overlap,
+            forbidden_differences=()):
+        """
+        Forbidden_differences are shifts (mod num_chambers) that must not
+        occur in the template at all, such as those between dont-mix pairs.
+        """
+        self._num_assays = num_assays
+        self._num_chambers = num_chambers
+        self._replicas = replicas
+        # limit[d] is how many times difference d may occur, or None for no
+        # limit (when d separates no pair of rows).
+        self._limit = [None] * num_chambers
+        for d in range(1, min(num_assays, num_chambers)):
+            self._limit[d] = max_overlap
+            self._limit[num_chambers - d] = max_overlap
+        for d in forbidden_differences:
+            self._limit[d % num_chambers] = 0
+
+
+    def is_valid(self, template):
+        """
+        Would shifting this template, once for each assay, give chamber sets
+        with no two having more than max_overlap chambers in common?
+        """
+        if self._num_assays > self._num_chambers:
+            # Rows would repeat.
+            return False
+        if len(set(template)) != self._replicas:
+            return False
+        counts = [0] * self._num_chambers
+        for a in template:
+            for b in template:
+                if a == b:
+                    continue
+                d = (b - a) % self._num_chambers
+                if self._limit[d] is None:
+                    continue
+                counts[d] += 1
+                if counts[d] > self._limit[d]:
+                    return False
+        return True
+
+
+    def valid_templates(self):
+        """
+        Yields valid templates (lists of zero-based chambers), the one that
+        has always been used first, if it is valid.
+        """
+        if self._num_assays > self._num_chambers or \
+                self._replicas > self._num_chambers:
+            return
+        seen = set()
+        for stride in self._strides():
+            template = self.arithmetic_template(stride)
+            key = frozenset(template)
+            if key in seen:
+                continue
+            seen.add(key)
+            if self.is_valid(template):
+                yield template
+        for template in self._depth_first():
+            if frozenset(template) not in seen:
+                yield template
+
+
+    def arithmetic_template(self, stride):
+        """
+        Replica r goes in chamber (stride * r), or the next unused chamber
+        after it.
+        """
+        chambers = []
+        for replica in range(self._replicas):
+            chamber = (stride * replica) % self._num_chambers
+            # If this is a diagonal we already used, move to the next
+            # unused diagonal.
+            while chamber in chambers:
+                chamber = (chamber + 1) % self._num_chambers
+            chambers.append(chamber)
+        return chambers
+
+
+    #------------------------------------------------------------------------
+    # Private / implementation methods below.
+    #------------------------------------------------------------------------
+
+    def _strides(self):
+        """
+        Num_assays first, then the others, nearest first.
+        """
+        strides = range(1, self._num_chambers)
+        return [self._num_assays] + sorted(strides, key=lambda stride:
+                (abs(stride - self._num_assays), stride))
+
+
+    def _depth_first(self):
+        """
+        Yields the valid templates that the budget allows, each starting at
+        chamber 0. (Shifting a template makes no difference to its validity.)
+        """
+        counts = [0] * self._num_chambers
+        template = [0]
+        budget = [_SEARCH_BUDGET]
+
+        def _extend(start):
+            needed = self._replicas - len(template)
+            if not needed:
+                yield list(template)
+                return
+            for chamber in range(start, self._num_chambers - needed + 1):
+                budget[0] -= 1
+                if budget[0] < 0:
+                    return
+                added = self._add_differences(counts, template, chamber)
+                if added is not None:
+                    template.append(chamber)
+                    for found in _extend(chamber + 1):
+                        yield found
+                    template.pop()
+                    for d in added:
+                        counts[d] -= 1
+
+        return _extend(1)
+
+
+    def _add_differences(self, counts, template, chamber):
+        """
+        Counts the limited differences between chamber and the template's
+        chambers. Provides the differences counted, or None (with counts left
+        as they were) if any would occur too often.
+        """
+        added = []
+        for other in template:
+            for d in ((chamber - other) % self._num_chambers,
+                    (other - chamber) % self._num_chambers):
+                if self._limit[d] is None:
+                    continue
+                counts[d] += 1
+                added.append(d)
+                if counts[d] > self._limit[d]:
+                    for undo in added:
+                        counts[undo] -= 1
+                    return None
+        return added
@@ -0,0 +1,66 @@
+"""
+An append-only store for the results of a design-of-experiments (DOE) sweep.
+
+Each result is written as one line of JSON, as soon as it is known, so a
+sweep that is interrupted loses nothing that had finished. When the sweep is
+re-run, the points that already have a result can be skipped.
+"""
+
+import json
+import os
+
+
+class DoeResultStore:
+    """
+    A file of DOE results, one JSON object per line. Each result must include
+    the fields that identify its design point. (See KEY_FIELDS.)
+    """
+
+    KEY_FIELDS = ('allocator', 'targets', 'assays', 'chambers')
+
+    def __init__(self, path):
+        self._path = path
+
+
+    def results(self):
+        """
+        Provide all the results recorded so far. A partly written last line
+        (from an interrupted sweep) is ignored.
+        """
+        if not os.path.exists(self._path):
+            return []
+        results = []
+        with open(self._path) as f:
+            for line in f:
+                try:
+                    results.append(json.loads(line))
+                except ValueError:
+                    continue
+        return results
+
+
+    def done_keys(self, statuses=None):
+        """
+        Provide the keys (see key()) of the design points that have a result
+        recorded. Optionally, only those with one of the given statuses.
+        """
+        return set(self.key(result) for result in self.results() if
+                statuses is None or result.get('status') in statuses)
+
+
+    def append(self, result):
+        """
+        Record the given result (a dict), durably.
+        """
+        with open(self._path, 'a') as f:
+            f.write(json.dumps(result, sort_keys=True) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+
+    @classmethod
+    def key(cls, result):
+        """
+        The tuple that identifies the design point of a result.
+        """
+        return tuple(result[field] for field in cls.KEY_FIELDS)
@@ -0,0 +1,93 @@
+"""
+The dont-mix rules of an ExperimentDesign, compiled into bitmasks.
+
+The rules are consulted for every chamber of every candidate chamber set, for
+every assay, which is millions of rule evaluations for a design with a long
+dont-mix list. Compiled once, each assay gets a bitmask of the assays it must
+not share a chamber with. Then, as assays are placed, each assay's mask of the
+chambers it can no longer go into is kept up to date. Whether a chamber set is
+compatible with an assay is then a single mask test. And the forbidden
+chambers can be left out of candidate generation altogether.
+
+Chamber masks use bit <c> for chamber number <c>.
+
+The rules are taken to be pairwise (as the dont-mix *pairs* in an
+ExperimentDesign are). So they are compiled by asking the design about each
+pair of assays in turn.
+"""
+
+
+class DontMixMasks:
+    """
+    Compiled dont-mix rules, plus the running state of which chambers each
+    assay is barred from. Any allocator can use one, provided it tells it
+    about each placement it commits to.
+    """
+
+    def __init__(self, experiment_design):
+        """
+        Provide the ExperimentDesign whose dont-mix rules are to be compiled.
+        """
+        assays = experiment_design.assay_types_in_priority_order()
+        self._bit_for = {}
+        for position, assay in enumerate(assays):
+            self._bit_for[assay] = 1 << position
+        # Assay -> bitmask of the assays it must not share a chamber with.
+        self._forbidden_partners = {}
+        for assay in assays:
+            partners = 0
+            for other in assays:
+                if other == assay:
+                    continue
+                if not experiment_design.can_this_assay_go_into_this_mixture(
+                        assay, set([other])):
+                    partners |= self._bit_for[other]
+            self._forbidden_partners[assay] = partners
+        # Assay -> bitmask of the chambers it can no longer be put into.
+        self._forbidden_chambers = dict.fromkeys(assays, 0)
+
+
+    def forbidden_partners(self, assay):
+        """
+        The bitmask of the assays that must not share a chamber with the given
+        assay.
+        """
+        return self._forbidden_partners[assay]
+
+
+    def forbidden_chambers(self, assay):
+        """
+        The bitmask of the chambers that the given assay can no longer be put
+        into, because of the placements made so far.
+        """
+        return self._forbidden_chambers[assay]
+
+
+    def allowed(self, assay, chamber_set):
+        """
+        Can the given assay be put into all of the chambers in chamber_set?
+        """
+        return not chamber_mask(chamber_set) & \
+                self._forbidden_chambers[assay]
+
+
+    def place(self, assay, chamber_set):
+        """
+        Register that the given assay has been placed in each of the chambers
+        in chamber_set. This bars its dont-mix partners from those chambers.
+        """
+        bit = self._bit_for[assay]
+        chambers = chamber_mask(chamber_set)
+        for other, partners in self._forbidden_partners.items():
+            if partners & bit:
+                self._forbidden_chambers[other] |= chambers
+
+
+def chamber_mask(chamber_set):
+    """
+    The chamber bitmask for the given chamber set.
+    """
+    mask = 0
+    for chamber in chamber_set:
+        mask |= 1 << chamber
+    return mask
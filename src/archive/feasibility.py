@@ -0,0 +1,143 @@
+"""
+Quick tests that can prove an allocation problem has no solution, before any
+time is spent searching for one.
+
+Each test is a counting bound, worked out in exact integer arithmetic. If a
+design breaks one, no allocation can exist, whatever search is used. Passing
+them all does not mean an allocation exists, only that these bounds cannot
+rule it out.
+
+THE BOUNDS
+
+Replicas: each assay's replicas need chambers of their own, so there must be
+at least as many chambers as replicas.
+
+Packing (Johnson): the allocators keep any two assays' chamber sets from
+having more than a certain number of chambers in common. (AvoidsFP allows 1,
+DiagonalsAllocator allows sim_targets - 1.) The number of chamber sets of
+size w, drawn from n chambers, with no two sharing more than L chambers, is
+at most
+
+    J(n, w, L) = floor(n/w * J(n-1, w-1, L-1)),   J(n, w, 0) = floor(n/w)
+
+(Count the sets containing any one chamber: removing that chamber from each
+leaves a smaller family of the same sort.) There must be no more assays than
+that.
+
+Information: an allocation that avoids all false positives lets every
+combination of up to sim_targets targets be told apart from the chambers that
+fire. There are sum(C(assays, i), i = 0..sim_targets) such combinations, but
+only 2**chambers firing patterns.
+"""
+
+from lib.model.chambersetpool import _binomial
+
+
+class Verdict:
+    """
+    The result of a feasibility test. If ruled_out is True, bound names the
+    bound that ruled the design out, and reason explains it.
+    """
+
+    def __init__(self, ruled_out, bound=None, reason=None):
+        self.ruled_out = ruled_out
+        self.bound = bound
+        self.reason = reason
+
+
+class Feasibility:
+    """
+    Counting bounds for allocating num_assays assay types to num_chambers
+    chambers, such that up to sim_targets simultaneous targets are handled.
+    """
+
+    def __init__(self, num_assays, num_chambers, sim_targets):
+        self.num_assays = num_assays
+        self.num_chambers = num_chambers
+        self.sim_targets = sim_targets
+
+
+    @classmethod
+    def from_design(cls, experiment_design):
+        return cls(len(experiment_design.assay_types_in_priority_order()),
+                experiment_design.num_chambers, experiment_design.sim_targets)
+
+
+    def check(self, replicas, max_overlap, avoids_false_positives=True):
+        """
+        Applies all the bounds that are relevant to an allocator that gives
+        each assay this many replicas, and that lets no two assays have more
+        than max_overlap chambers in common. The information bound only
+        applies if the allocator guarantees to avoid false positives. Provides
+        a Verdict, from the first bound to rule the design out, if any.
+        """
+        if replicas > self.num_chambers:
+            return Verdict(True, 'replicas',
+                    '%d replicas need more than the %d chambers available' %
+                    (replicas, self.num_chambers))
+
+        most_assays = self.packing_bound(replicas, max_overlap)
+        if self.num_assays > most_assays:
+            return Verdict(True, 'packing',
+                    'at most %d sets of %d chambers out of %d can have no '
+                    'more than %d in common, but %d assays need them' %
+                    (most_assays, replicas, self.num_chambers, max_overlap,
+                    self.num_assays))
+
+        if avoids_false_positives:
+            combinations = self.target_combinations()
+            if combinations > 2 ** self.num_chambers:
+                return Verdict(True, 'information',
+                        '%d combinations of up to %d targets cannot be told '
+                        'apart with %d chambers' % (combinations,
+                        self.sim_targets, self.num_chambers))
+
+        return Verdict(False)
+
+
+    def packing_bound(self, set_size, max_overlap):
+        """
+        The most chamber sets of the given size there can be, with no two
+        having more than max_overlap chambers in common. (The Johnson bound.)
+        """
+        return _johnson(self.num_chambers, set_size, max_overlap)
+
+
+    def target_combinations(self):
+        """
+        How many combinations of up to sim_targets targets there are,
+        including none at all.
+        """
+        return sum(_binomial(self.num_assays, i) for
+                i in range(self.sim_targets + 1))
+
+
+    def information_min_chambers(self):
+        """
+        The fewest chambers with which the information bound can be met.
+        """
+        return (self.target_combinations() - 1).bit_length()
+
+
+    def packing_min_chambers(self, set_size, max_overlap):
+        """
+        The fewest chambers with which the packing bound can be met.
+        """
+        num_chambers = set_size
+        while _johnson(num_chambers, set_size, max_overlap) < self.num_assays:
+            num_chambers += 1
+        return num_chambers
+
+
+#------------------------------------------------------------------------
+# Private / implementation functions below.
+#------------------------------------------------------------------------
+
+def _johnson(n, w, overlap):
+    if w > n:
+        return 0
+    if overlap >= w:
+        return _binomial(n, w)
+    if overlap <= 0:
+        return n // w
+    return n * _johnson(n - 1, w - 1, overlap - 1) // w
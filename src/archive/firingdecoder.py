@@ -0,0 +1,134 @@
+"""
+Decodes which chambers fired, in a run, into which targets were present.
+
+An allocation made by AvoidsFP gives each assay type a reserved chamber set,
+such that while no more than sim_targets targets are present, the reserved
+chambers of an assay all fire only if its target is present. So the targets
+to call are exactly those whose assay's reserved chambers all fired.
+
+Any chamber that fired must be explained by a target that was called: one of
+the called targets' assays must be in it. If not, no set of targets could have
+produced that pattern (with a perfect instrument). It is flagged as
+unexplained, because either more targets were present than the allocation
+caters for, or a chamber misbehaved.
+
+Runs are decoded in bulk. Each run's firing pattern is packed into 64-bit
+words (one bit per chamber), and each assay's reserved set likewise. Calling
+an assay for every run in a batch is then a couple of array operations.
+
+NumPy is needed to use it.
+"""
+
+import numpy as np
+
+
+# How many runs to decode at a time. Small enough for the working arrays to
+# stay in cache.
+_BATCH_RUNS = 65536
+
+
+class FiringDecoder:
+    """
+    Decodes firing patterns for one finished Allocation.
+    """
+
+    def __init__(self, experiment_design, alloc):
+        """
+        Provide the ExperimentDesign and the Allocation made for it.
+        """
+        self._set_columns(sorted(experiment_design.set_of_all_chambers()),
+                [assay for assay in
+                experiment_design.assay_types_in_priority_order() if
+                assay in alloc.all_assays()])
+
+        # Assay x word. The reserved chamber set of each assay, packed.
+        self._reserved = np.zeros((len(self.assays), self._words),
+                dtype=np.uint64)
+        for row, assay in enumerate(self.assays):
+            pattern = np.zeros((1, len(self.chambers)), dtype=bool)
+            for chamber in alloc.chambers_for(assay):
+                pattern[0, self._column_for[chamber]] = True
+            self._reserved[row] = self._pack(pattern)[0]
+
+
+    @classmethod
+    def from_file(cls, allocation_file):
+        """
+        A decoder for the allocation in an AllocationFile. The reserved sets
+        in the file are used where they are, without being copied.
+        """
+        decoder = cls.__new__(cls)
+        decoder._set_columns(list(allocation_file.chambers),
+                allocation_file.all_assays())
+        decoder._reserved = allocation_file.reserved_words()
+        return decoder
+
+
+    def decode(self, firing):
+        """
+        Firing is an array of runs x chambers (columns in the order of
+        self.chambers), true or non-zero where the chamber fired. Provides
+        (called, unexplained): a boolean array of runs x assays (columns in
+        the order of self.assays), true where the target is called, and a
+        boolean array that is true for each run whose firing pattern cannot
+        be explained.
+        """
+        firing = np.asarray(firing)
+        if firing.ndim != 2 or firing.shape[1] != len(self.chambers):
+            raise ValueError('Expected an array of runs x %d chambers' %
+                    len(self.chambers))
+        runs = firing.shape[0]
+        called = np.empty((runs, len(self.assays)), dtype=bool)
+        unexplained = np.empty(runs, dtype=bool)
+        for start in range(0, runs, _BATCH_RUNS):
+            stop = min(start + _BATCH_RUNS, runs)
+            self._decode_batch(self._pack(firing[start:stop]),
+                    called[start:stop], unexplained[start:stop])
+        return called, unexplained
+
+
+    def decode_one(self, fired_chambers):
+        """
+        Decodes a single run, given the chambers that fired. Provides
+        (called_assays, unexplained), with called_assays as a frozenset.
+        """
+        pattern = np.zeros((1, len(self.chambers)), dtype=bool)
+        for chamber in fired_chambers:
+            pattern[0, self._column_for[chamber]] = True
+        called, unexplained = self.decode(pattern)
+        called_assays = frozenset(assay for assay, hit in
+                zip(self.assays, called[0]) if hit)
+        return called_assays, bool(unexplained[0])
+
+
+    #------------------------------------------------------------------------
+    # Private / implementation methods below.
+    #------------------------------------------------------------------------
+
+    def _set_columns(self, chambers, assays):
+        # The order of the columns in firing patterns, and in the calls.
+        self.chambers = chambers
+        self.assays = assays
+        self._column_for = {}
+        for column, chamber in enumerate(self.chambers):
+            self._column_for[chamber] = column
+        self._words = (len(self.chambers) + 63) // 64
+
+
+    def _pack(self, firing):
+        """
+        Runs x chambers booleans -> runs x words, one bit per chamber.
+        """
+        packed = np.packbits(firing.astype(bool), axis=1, bitorder='little')
+        padded = np.zeros((len(firing), self._words * 8), dtype=np.uint8)
+        padded[:, :packed.shape[1]] = packed
+        return padded.view('<u8')
+
+
+    def _decode_batch(self, fired, called, unexplained):
+        explained = np.zeros_like(fired)
+        for row, reserved in enumerate(self._reserved):
+            hit = ((fired & reserved) == reserved).all(axis=1)
+            called[:, row] = hit
+            explained |= np.where(hit[:, None], reserved, np.uint64(0))
+        unexplained[:] = (explained != fired).any(axis=1)
@@ -0,0 +1,187 @@
+"""
+Certifies that an allocation cannot produce false positives, regardless of
+which allocator made it.
+
+The claim to be proved is: there is no set of up to sim_targets targets
+which, without assay P's target being present, makes every chamber of P's
+reserved set fire. For every assay P. (The reserved set of an assay is taken
+to be all of the chambers it was allocated to.)
+
+Each reserved set is checked with the hitting set search of CoverSearch,
+over assay bitmasks, which gives up on a reserved set as soon as it finds a
+set of targets that would make it fire. Those targets are the counterexample.
+The reserved sets are independent of each other, so for large allocations
+they are shared out over a pool of worker processes. The certifier stops at
+the first counterexample unless asked to find them all.
+"""
+
+import multiprocessing
+
+from lib.model.assaybitmasks import AssayBitmasks
+from lib.model.coversearch import CoverSearch
+
+
+# Allocations with fewer assay types than this are certified in this process,
+# because starting the workers would take longer than the work itself.
+_MIN_ASSAYS_FOR_WORKERS = 1000
+
+# How many reserved sets each piece of work sent to a worker contains.
+_CHUNK_SIZE = 8
+
+
+class Counterexample:
+    """
+    A set of targets that, without the target of the reserving assay, makes
+    every chamber of its reserved set fire.
+    """
+
+    def __init__(self, reserving_assay, reserved_chamber_set, targets):
+        self.reserving_assay = reserving_assay
+        self.reserved_chamber_set = reserved_chamber_set
+        self.targets = targets
+
+
+class Certificate:
+    """
+    The outcome of certifying an allocation. Certified is True when there
+    are no counterexamples.
+    """
+
+    def __init__(self, sim_targets, counterexamples):
+        self.sim_targets = sim_targets
+        self.counterexamples = counterexamples
+        self.certified = not counterexamples
+
+
+    def report(self):
+        """
+        A human readable account of the outcome.
+        """
+        if self.certified:
+            return _CERTIFIED % self.sim_targets
+        lines = [_NOT_CERTIFIED % (self.sim_targets,
+                len(self.counterexamples))]
+        for example in self.counterexamples:
+            lines.append(_COUNTEREXAMPLE % (example.reserving_assay,
+                    sorted(example.reserved_chamber_set),
+                    ', '.join(sorted(str(t) for t in example.targets)),
+                    example.reserving_assay))
+        return ''.join(lines)
+
+
+class FalsePositiveCertifier:
+    """
+    Proves, or finds counterexamples to, an allocation's freedom from false
+    positives.
+    """
+
+    def __init__(self, sim_targets, workers=None, find_all=False):
+        """
+        Sim_targets is the largest number of simultaneous targets to protect
+        against. Workers is the most worker processes to use. (Defaults to
+        the number of CPUs. 1 means none.) If find_all is True, every
+        reserved set that has a counterexample is reported, rather than just
+        the first one found.
+        """
+        self._sim_targets = sim_targets
+        self._workers = workers or multiprocessing.cpu_count()
+        self._find_all = find_all
+
+
+    def certify(self, alloc):
+        """
+        Provides a Certificate for the given Allocation.
+        """
+        assays = list(alloc.all_assays())
+        masks = AssayBitmasks(assays)
+        for assay in assays:
+            masks.add(assay, alloc.chambers_for(assay))
+        # Target sets of any size up to sim_targets count, so there must
+        # always be enough assays to pad a small one out.
+        num_assays = max(len(assays), self._sim_targets + 1)
+
+        jobs = []
+        for assay in assays:
+            chamber_masks = [masks.chamber_mask(chamber) for
+                    chamber in alloc.chambers_for(assay)]
+            jobs.append((masks.bit_for(assay), chamber_masks))
+        chunks = [(self._sim_targets, num_assays, jobs[i:i + _CHUNK_SIZE]) for
+                i in range(0, len(jobs), _CHUNK_SIZE)]
+
+        covers = []
+        checks = self._check(chunks)
+        try:
+            for found in checks:
+                covers.extend(found)
+                if covers and not self._find_all:
+                    break
+        finally:
+            checks.close()
+
+        assay_for_bit = dict((masks.bit_for(assay), assay) for
+                assay in assays)
+        counterexamples = []
+        for reserving_bit, cover in sorted(covers):
+            reserving_assay = assay_for_bit[reserving_bit]
+            targets = frozenset(assay for bit, assay in
+                    assay_for_bit.items() if cover & bit)
+            counterexamples.append(Counterexample(reserving_assay,
+                    frozenset(alloc.chambers_for(reserving_assay)), targets))
+        return Certificate(self._sim_targets, counterexamples)
+
+
+    #------------------------------------------------------------------------
+    # Private / implementation methods below.
+    #------------------------------------------------------------------------
+
+    def _check(self, chunks):
+        """
+        Yields the list of (reserving_bit, cover) found for each chunk.
+        """
+        num_jobs = sum(len(chunk[2]) for chunk in chunks)
+        if self._workers <= 1 or num_jobs < _MIN_ASSAYS_FOR_WORKERS:
+            for chunk in chunks:
+                yield _check_chunk(chunk)
+            return
+        pool = multiprocessing.Pool(min(self._workers, len(chunks)))
+        try:
+            for found in pool.imap_unordered(_check_chunk, chunks):
+                yield found
+        finally:
+            # Abandons any work still in hand, once we have what we need.
+            pool.terminate()
+            pool.join()
+
+
+def _check_chunk(chunk):
+    """
+    Provide (reserving_bit, cover) for each reserved set in the chunk that
+    some target set can make fire. Runs in the workers.
+    """
+    sim_targets, num_assays, jobs = chunk
+    cover_search = CoverSearch(sim_targets, num_assays)
+    found = []
+    for reserving_bit, chamber_masks in jobs:
+        cover = cover_search.find_cover(chamber_masks, reserving_bit)
+        if cover is not None:
+            found.append((reserving_bit, cover))
+    return found
+
+
+_CERTIFIED = \
+"""
+CERTIFIED: no set of up to %d targets makes every chamber reserved by an
+assay fire, unless that assay's target is present.
+"""
+
+_NOT_CERTIFIED = \
+"""
+NOT CERTIFIED: with up to %d targets present, false positives are possible.
+Counterexamples found: %d
+"""
+
+_COUNTEREXAMPLE = \
+"""
+The chambers reserved by <%s>, which are %s,
+all fire when targets <%s> are present, without <%s>.
+"""
@@ -0,0 +1,165 @@
+"""
+Wraps an Allocation with the indexes that an allocator's inner loops need, and
+provides copy-free "what-if" views of it.
+
+Testing a candidate chamber set used to mean registering the assay with the
+Allocation, asking the questions, then unregistering it again. That mutates
+the Allocation twice per hypothesis. A TentativeAllocation instead answers
+occupancy and reservation queries as if the assay had been added, by
+consulting the underlying allocation and the one proposed placement. Nothing
+is altered until the placement is committed. Discarding one costs nothing.
+
+The indexes kept are:
+
+    chamber -> the reserved chamber sets that include it
+    reserved chamber set -> the assay that reserved it
+
+So finding the reserved chamber sets that a candidate touches needs no scan
+of every reserved chamber set.
+"""
+
+
+class IndexedAllocation:
+    """
+    An Allocation, together with its AssayBitmasks shadow, and lookup indexes
+    for its reserved chamber sets. All changes must go through commit().
+    """
+
+    def __init__(self, alloc, assay_bitmasks):
+        """
+        Provide the (initially empty) Allocation to wrap, and the
+        AssayBitmasks that will shadow it.
+        """
+        self.alloc = alloc
+        self.masks = assay_bitmasks
+        self._reserved_sets_by_chamber = {}
+        self._assay_by_reserved_set = {}
+
+
+    def commit(self, assay, chamber_set):
+        """
+        Place the given assay into chamber_set, reserving that chamber set
+        for it.
+        """
+        self.alloc.allocate(assay, chamber_set)
+        self.masks.add(assay, chamber_set)
+        self._assay_by_reserved_set[chamber_set] = assay
+        for chamber in chamber_set:
+            self._reserved_sets_by_chamber.setdefault(
+                    chamber, []).append(chamber_set)
+
+
+    def tentative(self, assay, chamber_set):
+        """
+        Provide a TentativeAllocation, that shows this allocation as it
+        would be with the given assay added into chamber_set.
+        """
+        return TentativeAllocation(self, assay, chamber_set)
+
+
+    def assay_types_present_in(self, chamber):
+        return self.alloc.assay_types_present_in(chamber)
+
+
+    def chamber_mask(self, chamber):
+        """
+        The bitmask of the assay types present in the given chamber.
+        """
+        return self.masks.chamber_mask(chamber)
+
+
+    def reserved_chamber_sets(self):
+        return list(self._assay_by_reserved_set)
+
+
+    def which_assay_reserved_this_chamber_set(self, chamber_set):
+        return self._assay_by_reserved_set[chamber_set]
+
+
+    def reserved_chamber_sets_touching(self, chamber_set):
+        """
+        Provide those of the reserved chamber sets that have at least one
+        chamber in common with the one given.
+        """
+        touching = set()
+        for chamber in chamber_set:
+            touching.update(self._reserved_sets_by_chamber.get(chamber, ()))
+        return touching
+
+
+class TentativeAllocation:
+    """
+    A read-only view of an IndexedAllocation, as it would be with one more
+    assay placed. (To make the placement for real, commit it to the
+    IndexedAllocation.)
+    """
+
+    def __init__(self, base, assay, chamber_set):
+        self._base = base
+        self.assay = assay
+        self.chamber_set = chamber_set
+        self._bit = base.masks.bit_for(assay)
+
+
+    def discard(self):
+        """
+        Abandon the tentative placement. There is nothing to undo.
+        """
+        pass
+
+
+    def assay_types_present_in(self, chamber):
+        # A copy, so as not to alter the allocation being viewed.
+        occupants = set(self._base.assay_types_present_in(chamber))
+        if chamber in self.chamber_set:
+            occupants.add(self.assay)
+        return occupants
+
+
+    def chamber_mask(self, chamber):
+        """
+        The bitmask of the assay types that would be present in the given
+        chamber.
+        """
+        mask = self._base.chamber_mask(chamber)
+        if chamber in self.chamber_set:
+            mask |= self._bit
+        return mask
+
+
+    def reserved_chamber_sets(self):
+        return self._base.reserved_chamber_sets() + [self.chamber_set]
+
+
+    def which_assay_reserved_this_chamber_set(self, chamber_set):
+        if chamber_set == self.chamber_set:
+            return self.assay
+        return self._base.which_assay_reserved_this_chamber_set(chamber_set)
+
+
+    def reserved_chamber_sets_touching(self, chamber_set):
+        """
+        As IndexedAllocation.reserved_chamber_sets_touching(), including the
+        tentatively reserved chamber set.
+        """
+        touching = self._base.reserved_chamber_sets_touching(chamber_set)
+        if not self.chamber_set.isdisjoint(chamber_set):
+            touching.add(self.chamber_set)
+        return touching
+
+
+    def all_would_fire(self, chamber_set_147, target_mask_ADFN):
+        """
+        Would the presence of the targets in target_mask_ADFN cause every
+        chamber in chamber_set_147 to fire?
+        """
+        chamber_mask = self._base.masks.chamber_mask
+        for chamber in chamber_set_147:
+            mask = chamber_mask(chamber)
+            if chamber in self.chamber_set:
+                mask |= self._bit
+            # Only needs one chamber to have no occupants in common with the
+            # target set to conclude False.
+            if not mask & target_mask_ADFN:
+                return False
+        return True
@@ -0,0 +1,171 @@
+"""
+Finds the fewest chambers with which an allocator can allocate a given number
+of assays, for a given number of simultaneous targets.
+
+Rather than trying every chamber count in turn, this relies on the answer
+being monotone in the number of chambers: if an allocation can be made with
+n chambers, one can be made with more. (More chambers only ever give the
+allocators more room.) So it bisects between a count known not to work and a
+count known to work:
+
+    The lower end starts just below the fewest chambers that the allocator's
+    feasibility bounds do not rule out.
+
+    The upper end is given by the caller, or found by trying counts above
+    the lower end at doubling distances, until one works.
+
+Each attempt runs in a child process with its own time budget. An attempt
+that runs out of time is counted as not working, as is one whose allocation
+fails the FalsePositiveCertifier. The allocation from the best attempt so far
+is kept, so the search ends with the minimum and an allocation that achieves
+it, after a number of allocator runs that grows only with the logarithm of
+the range searched.
+"""
+
+from lib.model.experimentdesign import ExperimentDesign
+from lib.model.fpcertifier import FalsePositiveCertifier
+from lib.model.processrunner import ProcessRunner
+
+
+class MinChambersResult:
+    """
+    The outcome of a MinChamberSearch. Min_chambers and allocation are None
+    if no chamber count up to the maximum worked. Attempts lists the
+    (chambers, status) of each attempt made, in order. The status is one of
+    'worked', 'failed', 'uncertified', 'timeout', 'infeasible' or 'error'.
+    ('Uncertified' means an allocation was produced, but the
+    FalsePositiveCertifier found it could give false positives.)
+    """
+
+    def __init__(self, min_chambers, allocation, attempts):
+        self.min_chambers = min_chambers
+        self.allocation = allocation
+        self.attempts = attempts
+
+
+class MinChamberSearch:
+    """
+    Bisects on the number of chambers, for one allocator class.
+    """
+
+    def __init__(self, allocator_class, num_assays, sim_targets,
+            timeout=None, upper=None, max_chambers=256):
+        """
+        Timeout is the number of seconds allowed to each attempt, or None for
+        no limit. Upper is a chamber count known (or believed) to work, if
+        there is one. No chamber count above max_chambers is tried.
+        """
+        self._allocator_class = allocator_class
+        self._num_assays = num_assays
+        self._sim_targets = sim_targets
+        self._runner = ProcessRunner(1, timeout)
+        self._upper = upper
+        self._max_chambers = max_chambers
+        self._attempts = []
+        self._best = None
+
+
+    def search(self):
+        """
+        Provides a MinChambersResult.
+        """
+        lower = self._lower_bound()
+        if lower is None:
+            return self._result()
+        known_to_fail = lower - 1
+
+        # Find a count that works.
+        if self._upper is not None:
+            self._attempt(min(self._upper, self._max_chambers))
+        else:
+            step = 1
+            while self._best is None:
+                # Never going past max_chambers, but always trying it
+                # before giving up.
+                chambers = min(known_to_fail + step, self._max_chambers)
+                if not self._attempt(chambers):
+                    if chambers == self._max_chambers:
+                        break
+                    known_to_fail = chambers
+                    step *= 2
+        if self._best is None:
+            return self._result()
+
+        # Narrow down the gap between the two.
+        while self._best[0] - known_to_fail > 1:
+            chambers = (known_to_fail + self._best[0]) // 2
+            if not self._attempt(chambers):
+                known_to_fail = chambers
+        return self._result()
+
+
+    #------------------------------------------------------------------------
+    # Private / implementation methods below.
+    #------------------------------------------------------------------------
+
+    def _lower_bound(self):
+        """
+        The fewest chambers not ruled out by the allocator's feasibility
+        bounds, or None if every count up to the maximum is.
+        """
+        # Not every allocator knows its feasibility bounds.
+        feasibility = getattr(self._allocator_class, 'feasibility', None)
+        for chambers in range(1, self._max_chambers + 1):
+            if feasibility is None:
+                return chambers
+            if not feasibility(self._design(chambers)).ruled_out:
+                return chambers
+        return None
+
+
+    def _attempt(self, chambers):
+        """
+        Tries an allocation with this many chambers, and says if it worked.
+        """
+        job = (self._allocator_class, self._num_assays, chambers,
+                self._sim_targets)
+        outcome, = self._runner.run(_allocate, [job])
+        if outcome.status == 'done':
+            status, allocation = outcome.value
+        else:
+            status, allocation = outcome.status, None
+        self._attempts.append((chambers, status))
+        if status != 'worked':
+            return False
+        if self._best is None or chambers < self._best[0]:
+            self._best = (chambers, allocation)
+        return True
+
+
+    def _design(self, chambers):
+        return ExperimentDesign.make_from_params(self._num_assays, chambers,
+                self._sim_targets, 0)
+
+
+    def _result(self):
+        if self._best is None:
+            return MinChambersResult(None, None, self._attempts)
+        chambers, allocation = self._best
+        return MinChambersResult(chambers, allocation, self._attempts)
+
+
+def _allocate(job):
+    """
+    Runs in a child process.
+    """
+    allocator_class, num_assays, chambers, sim_targets = job
+    experiment_design = ExperimentDesign.make_from_params(
+            num_assays, chambers, sim_targets, 0)
+    feasibility = getattr(allocator_class, 'feasibility', None)
+    if feasibility is not None and \
+            feasibility(experiment_design).ruled_out:
+        return 'infeasible', None
+    try:
+        alloc = allocator_class(experiment_design).allocate()
+    except RuntimeError:
+        return 'failed', None
+    # Already in a child process, so the certifier need not start more.
+    certifier = FalsePositiveCertifier(sim_targets, workers=1)
+    if not certifier.certify(alloc).certified:
+        return 'uncertified', None
+    return 'worked', alloc
@@ -0,0 +1,103 @@
+"""
+A NumPy implementation of the vulnerability test that AvoidsFP runs for each
+reserved chamber set.
+
+The pure-Python test walks the possible target sets one at a time. This one
+holds the assay-to-chamber incidence as a boolean matrix, and the whole family
+of possible target sets as a bit-packed array (one row per target set, one bit
+per assay). Then the question "does any target set that excludes the reserving
+assay make every chamber of this reserved set fire?" is answered for all the
+target sets at once, with a handful of array operations.
+
+NumPy is only needed when this backend is selected.
+"""
+
+import numpy as np
+
+
+class NumpyVulnerabilityEngine:
+    """
+    Answers the same question as AvoidsFP's pure-Python vulnerability test,
+    and gives identical answers. Like AssayBitmasks, it must be told about
+    every assay its owner commits to the Allocation.
+    """
+
+    def __init__(self, assay_types, chambers, target_sets):
+        """
+        Provide the assay types that can ever be present, all the chambers
+        that can be used, and the possible target sets to consider.
+        """
+        self._column_for = {}
+        for column, assay in enumerate(assay_types):
+            self._column_for[assay] = column
+        self._row_for = {}
+        for row, chamber in enumerate(sorted(chambers)):
+            self._row_for[chamber] = row
+
+        # Chamber x assay incidence. True where the assay is present in the
+        # chamber.
+        self._incidence = np.zeros(
+                (len(self._row_for), len(self._column_for)), dtype=bool)
+
+        # Target set x assay membership, kept unpacked so that we can select
+        # the target sets that exclude a given assay.
+        self._membership = np.zeros(
+                (len(target_sets), len(self._column_for)), dtype=bool)
+        for row, target_set_ADFN in enumerate(target_sets):
+            for assay in target_set_ADFN:
+                self._membership[row, self._column_for[assay]] = True
+
+        # Packed form of the target sets, that exclude each assay. Built on
+        # demand, because only reserving assays are ever asked about.
+        self._packed_excluding = {}
+
+
+    def add(self, assay, chamber_set):
+        """
+        Register that the given assay has been placed in each of the chambers
+        in chamber_set.
+        """
+        self._incidence[self._rows(chamber_set), self._column_for[assay]] = \
+                True
+
+
+    def is_vulnerable(self, reserved_chamber_set, reserving_assay,
+            tentative=None):
+        """
+        Is there any possible target set, which does not include the
+        reserving assay, whose presence would make every chamber in the
+        reserved chamber set fire? If a TentativeAllocation is given, the
+        question is asked with its tentative placement included.
+        """
+        targets = self._packed_target_sets_excluding(reserving_assay)
+        if len(targets) == 0:
+            return False
+        rows = self._rows(reserved_chamber_set)
+        incidence = self._incidence[rows]
+        if tentative is not None:
+            incidence[:, self._column_for[tentative.assay]] |= [
+                    chamber in tentative.chamber_set for
+                    chamber in reserved_chamber_set]
+        occupants = np.packbits(incidence, axis=1)
+        # (target set x chamber). True when the target set shares at least
+        # one assay with the chamber's occupants, i.e. the chamber fires.
+        fires = (targets[:, np.newaxis, :] &
+                occupants[np.newaxis, :, :]).any(axis=2)
+        return bool(fires.all(axis=1).any())
+
+
+    #------------------------------------------------------------------------
+    # Private / implementation methods below.
+    #------------------------------------------------------------------------
+
+    def _rows(self, chamber_set):
+        return [self._row_for[chamber] for chamber in chamber_set]
+
+
+    def _packed_target_sets_excluding(self, assay):
+        packed = self._packed_excluding.get(assay)
+        if packed is None:
+            keep = ~self._membership[:, self._column_for[assay]]
+            packed = np.packbits(self._membership[keep], axis=1)
+            self._packed_excluding[assay] = packed
+        return packed
@@ -0,0 +1,131 @@
+"""
+An allocator that races several allocation methods against each other.
+
+Whether an allocation can be found depends heavily on which allocator is used,
+and (for AvoidsFP) on the order in which the assay types are allocated. So this
+runs a portfolio of them at the same time, in separate processes:
+
+    AvoidsFP, in the experiment design's priority order
+    DepletingPoolAllocator
+    DiagonalsAllocator
+    AvoidsFP, once for each of several seeded, shuffled assay orders
+
+The first allocation to pass verification is used, and the rest are
+cancelled. The shuffled orders are deterministic for a given seed, so a given
+portfolio always tries the same things.
+"""
+
+import random
+
+from lib.model.avoidfalsepos import AvoidsFP
+from lib.model.assaybitmasks import AssayBitmasks
+from lib.model.depletingpoolallocator import DepletingPoolAllocator
+from lib.model.diagonals import DiagonalsAllocator
+from lib.model.dontmixmasks import DontMixMasks
+from lib.model.fpcertifier import FalsePositiveCertifier
+from lib.model.processrunner import ProcessRunner
+
+
+class PortfolioAllocator:
+    """
+    Provides an allocation from whichever of a portfolio of allocators
+    produces a valid one first.
+    """
+
+    def __init__(self, experiment_design, seeds=(1, 2, 3, 4), workers=None,
+            timeout=None):
+        """
+        Provide an ExperimentDesign object when initialising the allocator.
+        Seeds are those used to shuffle the assay order for the additional
+        AvoidsFP runs. Workers is how many of the portfolio may run at the
+        same time (all of them by default). Timeout is the number of seconds
+        allowed to each member of the portfolio, or None for no limit.
+        """
+        self._design = experiment_design
+        self._entries = [('AvoidsFP', None), ('DepletingPoolAllocator', None),
+                ('DiagonalsAllocator', None)]
+        self._entries += [('AvoidsFP', seed) for seed in seeds]
+        self._workers = workers or len(self._entries)
+        self._timeout = timeout
+        # Which (allocator name, seed) produced the allocation.
+        self.winner = None
+
+
+    def allocate(self):
+        """
+        Entry point to the allocation algorithm.
+        """
+        jobs = [(self._design, name, seed) for name, seed in self._entries]
+        runner = ProcessRunner(self._workers, self._timeout)
+        outcomes = runner.run(_allocate_and_verify, jobs)
+        try:
+            for outcome in outcomes:
+                if outcome.status == 'done' and outcome.value is not None:
+                    design, name, seed = outcome.job
+                    self.winner = (name, seed)
+                    return outcome.value
+        finally:
+            # Cancels the rest.
+            outcomes.close()
+        raise RuntimeError(
+                'Cannot allocate: no allocator in the portfolio succeeded')
+
+
+#------------------------------------------------------------------------
+# Private / implementation functions below. These run in the child
+# processes.
+#------------------------------------------------------------------------
+
+def _allocate_and_verify(job):
+    """
+    Provides the allocation produced by one member of the portfolio, or None
+    if it could not produce one that passes verification.
+    """
+    experiment_design, name, seed = job
+    allocator = _make_allocator(experiment_design, name, seed)
+    try:
+        alloc = allocator.allocate()
+    except RuntimeError:
+        return None
+    if not _verify(experiment_design, alloc):
+        return None
+    return alloc
+
+
+def _make_allocator(experiment_design, name, seed):
+    if name == 'DepletingPoolAllocator':
+        return DepletingPoolAllocator(experiment_design)
+    if name == 'DiagonalsAllocator':
+        return DiagonalsAllocator(experiment_design)
+    priority_order = None
+    if seed is not None:
+        priority_order = list(experiment_design.assay_types_in_priority_order())
+        random.Random(seed).shuffle(priority_order)
+    return AvoidsFP(experiment_design, priority_order=priority_order)
+
+
+def _verify(experiment_design, alloc):
+    """
+    Does the allocation place every assay type, respect the dont-mix rules,
+    and leave no reserved chamber set that could all-fire in the absence of
+    its reserving assay?
+    """
+    assays = experiment_design.assay_types_in_priority_order()
+    if set(alloc.all_assays()) != set(assays):
+        return False
+
+    masks = AssayBitmasks(assays)
+    for assay in assays:
+        masks.add(assay, alloc.chambers_for(assay))
+
+    dont_mix = DontMixMasks(experiment_design)
+    for chamber in experiment_design.set_of_all_chambers():
+        occupants = masks.chamber_mask(chamber)
+        for assay in alloc.assay_types_present_in(chamber):
+            if dont_mix.forbidden_partners(assay) & occupants:
+                return False
+
+    # Already in a child process, so the certifier need not start more.
+    certifier = FalsePositiveCertifier(experiment_design.sim_targets,
+            workers=1)
+    return certifier.certify(alloc).certified
@@ -0,0 +1,158 @@
+"""
+Runs independent jobs in child processes, several at a time, each with an
+optional time limit.
+
+A multiprocessing.Pool cannot stop a single job that overruns without tearing
+down the whole pool. So instead each job gets a process of its own, and a
+one-way pipe to send its result back on. A job that overruns its time limit
+is terminated, and reported as having timed out, without disturbing the
+others.
+
+The function that is run, the jobs, and the values returned must all be
+picklable. (On Windows, the function must also be importable by name.)
+"""
+
+import multiprocessing
+import time
+
+
+# How long to sleep between looking for finished jobs, when none has.
+_POLL_INTERVAL = 0.01
+
+
+class JobOutcome:
+    """
+    What became of one job. Status is one of 'done', 'error' or 'timeout'.
+    Value is what the function returned (when 'done'), and error is a
+    description of the exception it raised (when 'error').
+    """
+
+    def __init__(self, job, status, value=None, error=None, seconds=None):
+        self.job = job
+        self.status = status
+        self.value = value
+        self.error = error
+        self.seconds = seconds
+
+
+class ProcessRunner:
+    """
+    Runs a function over a sequence of jobs, each in its own child process.
+    """
+
+    def __init__(self, workers=None, timeout=None):
+        """
+        Workers is how many jobs may run at the same time. (Defaults to the
+        number of CPUs.) Timeout is the number of seconds any one job may
+        take, or None for no limit.
+        """
+        self._workers = workers or multiprocessing.cpu_count()
+        self._timeout = timeout
+
+
+    def run(self, function, jobs):
+        """
+        Calls function(job) for each job. Yields a JobOutcome for each, in
+        the order they finish. Closing the generator early terminates any
+        jobs that are still running.
+        """
+        waiting = iter(jobs)
+        running = []
+        exhausted = False
+        try:
+            while True:
+                while not exhausted and len(running) < self._workers:
+                    try:
+                        job = next(waiting)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    running.append(_RunningJob(function, job))
+                if not running:
+                    return
+
+                finished = [r for r in running if r.has_finished()]
+                if not finished:
+                    overdue = [r for r in running if
+                            r.is_overdue(self._timeout)]
+                    for running_job in overdue:
+                        running_job.terminate()
+                        running.remove(running_job)
+                        yield JobOutcome(running_job.job, 'timeout',
+                                seconds=running_job.elapsed())
+                    if not overdue:
+                        time.sleep(_POLL_INTERVAL)
+                    continue
+
+                for running_job in finished:
+                    running.remove(running_job)
+                    yield running_job.outcome()
+        finally:
+            for running_job in running:
+                running_job.terminate()
+
+
+#------------------------------------------------------------------------
+# Private / implementation classes and functions below.
+#------------------------------------------------------------------------
+
+class _RunningJob:
+    """
+    One job, running in a child process.
+    """
+
+    def __init__(self, function, job):
+        self.job = job
+        self._started = time.time()
+        self._receiver, sender = multiprocessing.Pipe(duplex=False)
+        self._process = multiprocessing.Process(
+                target=_run_job, args=(function, job, sender))
+        self._process.daemon = True
+        self._process.start()
+        # Only the child should hold the sending end open.
+        sender.close()
+
+
+    def elapsed(self):
+        return time.time() - self._started
+
+
+    def has_finished(self):
+        return self._receiver.poll() or not self._process.is_alive()
+
+
+    def is_overdue(self, timeout):
+        return timeout is not None and self.elapsed() > timeout
+
+
+    def outcome(self):
+        try:
+            status, value, error, seconds = self._receiver.recv()
+        except EOFError:
+            status, value, error, seconds = ('error', None,
+                    'Child process exited with code %s' %
+                    self._process.exitcode, self.elapsed())
+        self._process.join()
+        self._receiver.close()
+        return JobOutcome(self.job, status, value, error, seconds)
+
+
+    def terminate(self):
+        self._process.terminate()
+        self._process.join()
+        self._receiver.close()
+
+
+def _run_job(function, job, sender):
+    """
+    The body of each child process.
+    """
+    started = time.time()
+    try:
+        value = function(job)
+        result = ('done', value, None, time.time() - started)
+    except Exception as e:
+        result = ('error', None, '%s: %s' % (e.__class__.__name__, e),
+                time.time() - started)
+    sender.send(result)
+    sender.close()
@@ -0,0 +1,187 @@
+"""
+Estimates, by simulation, how well an allocation performs when things are not
+as the allocator assumed.
+
+The allocators guarantee no false positives while no more than sim_targets
+targets are present, and every chamber behaves. This measures what happens
+otherwise:
+
+    More targets present than sim_targets.
+
+    Chambers that fail to fire when they should (dropouts), or that fire
+    when they should not (spurious firings).
+
+    A decoding rule that tolerates some of an assay's reserved chambers not
+    firing. (See RESILIENCE TO FAILING CHAMBERS in avoidfalsepos.py.)
+
+Each simulated run picks a random set of targets to be present, works out
+which chambers fire (with random dropouts and spurious firings), decodes the
+pattern, and compares the targets called with those present. Runs are done in
+large batches, as array operations. The rates reported come with Wilson score
+confidence intervals.
+
+Allocations can be compared fairly by giving each simulator the same seed,
+so that they all face the same random presence sets. (Provided they cover
+the same assay types.)
+
+NumPy is needed to use it.
+"""
+
+import math
+
+import numpy as np
+
+
+class Estimate:
+    """
+    A proportion estimated from <hits> out of <trials>, with a confidence
+    interval from low to high.
+    """
+
+    def __init__(self, hits, trials, z):
+        self.hits = hits
+        self.trials = trials
+        self.rate = float(hits) / trials if trials else 0.0
+        self.low, self.high = _wilson_interval(hits, trials, z)
+
+
+    def __str__(self):
+        return '%.6f [%.6f, %.6f]' % (self.rate, self.low, self.high)
+
+
+class SimulationResult:
+    """
+    The estimates produced by one simulation.
+
+        false_positive_runs     Fraction of runs with any false positive call.
+        missed_runs             Fraction of runs with any target missed.
+        false_positive_calls    Fraction of absent targets that were called.
+        missed_calls            Fraction of present targets not called.
+    """
+
+    def __init__(self, runs, counts, z):
+        self.runs = runs
+        fp_runs, missed_runs, fp_calls, absent, missed_calls, present = counts
+        self.false_positive_runs = Estimate(fp_runs, runs, z)
+        self.missed_runs = Estimate(missed_runs, runs, z)
+        self.false_positive_calls = Estimate(fp_calls, absent, z)
+        self.missed_calls = Estimate(missed_calls, present, z)
+
+
+    def report(self):
+        return _REPORT % (self.runs, self.false_positive_runs,
+                self.missed_runs, self.false_positive_calls,
+                self.missed_calls)
+
+
+class ResilienceSimulator:
+    """
+    Simulates runs against one Allocation.
+    """
+
+    def __init__(self, alloc, seed=None):
+        """
+        Provide the Allocation to simulate. Seed makes the random choices
+        repeatable.
+        """
+        self.assays = sorted(alloc.all_assays())
+        chambers = set()
+        for assay in self.assays:
+            chambers.update(alloc.chambers_for(assay))
+        self.chambers = sorted(chambers)
+        row_for = dict((chamber, row) for
+                row, chamber in enumerate(self.chambers))
+        # Chamber x assay. 1 where the assay is present in the chamber.
+        self._incidence = np.zeros((len(self.chambers), len(self.assays)),
+                dtype=np.float32)
+        for column, assay in enumerate(self.assays):
+            for chamber in alloc.chambers_for(assay):
+                self._incidence[row_for[chamber], column] = 1
+        self._reserved_sizes = self._incidence.sum(axis=0)
+        self._random = np.random.RandomState(seed)
+
+
+    def simulate(self, num_present, runs=100000, dropout=0.0, spurious=0.0,
+            tolerance=0, z=1.96, batch=65536):
+        """
+        Simulates <runs> runs, in each of which <num_present> targets, chosen
+        at random, are present. Each chamber that should fire fails to with
+        probability dropout, and each that should not fires anyway with
+        probability spurious. A target is called if no more than <tolerance>
+        of its assay's reserved chambers failed to fire. Z sets the width of
+        the confidence intervals. (1.96 for 95%.) Provides a
+        SimulationResult.
+        """
+        if not 0 <= num_present <= len(self.assays):
+            raise ValueError('Cannot have %d of %d targets present' %
+                    (num_present, len(self.assays)))
+        counts = np.zeros(6, dtype=np.int64)
+        done = 0
+        while done < runs:
+            size = min(batch, runs - done)
+            counts += self._simulate_batch(size, num_present, dropout,
+                    spurious, tolerance)
+            done += size
+        return SimulationResult(runs, [int(count) for count in counts], z)
+
+
+    #------------------------------------------------------------------------
+    # Private / implementation methods below.
+    #------------------------------------------------------------------------
+
+    def _simulate_batch(self, runs, num_present, dropout, spurious,
+            tolerance):
+        """
+        Provides the counts behind each estimate, for one batch of runs.
+        """
+        num_assays = len(self.assays)
+        # Runs x assays. A random set of num_present targets in each run.
+        order = self._random.random_sample((runs, num_assays)).argsort(axis=1)
+        present = order < num_present
+
+        # Runs x chambers. The chambers that fire.
+        fired = np.dot(present.astype(np.float32), self._incidence.T) > 0
+        if dropout:
+            fired &= self._random.random_sample(fired.shape) >= dropout
+        if spurious:
+            fired |= self._random.random_sample(fired.shape) < spurious
+
+        # Runs x assays. How many of each reserved set fired.
+        firing = np.dot(fired.astype(np.float32), self._incidence)
+        called = firing >= self._reserved_sizes - tolerance
+
+        false_positives = called & ~present
+        missed = present & ~called
+        return np.array([
+            false_positives.any(axis=1).sum(),
+            missed.any(axis=1).sum(),
+            false_positives.sum(),
+            runs * (num_assays - num_present),
+            missed.sum(),
+            runs * num_present,
+        ], dtype=np.int64)
+
+
+def _wilson_interval(hits, trials, z):
+    """
+    The Wilson score interval for a proportion.
+    """
+    if not trials:
+        return 0.0, 1.0
+    p = float(hits) / trials
+    denominator = 1 + z * z / trials
+    centre = (p + z * z / (2 * trials)) / denominator
+    margin = z * math.sqrt(p * (1 - p) / trials +
+            z * z / (4 * trials * trials)) / denominator
+    return max(0.0, centre - margin), min(1.0, centre + margin)
+
+
+_REPORT = \
+"""
+SIMULATED RUNS: %d
+
+Runs with a false positive:     %s
+Runs with a missed target:      %s
+False positive calls:           %s
+Missed calls:                   %s
+"""
@@ -0,0 +1,98 @@
+"""
+Speculative, parallel testing of candidate chamber sets for AvoidsFP.
+
+Within one assay, AvoidsFP tests candidate chamber sets strictly one after
+another, and late assays often reject hundreds of candidates before accepting
+one. Here a pool of worker processes tests the next batch of candidates at
+the same time instead. Each worker keeps its own copy of the allocator's
+state, brought up to date from the list of placements committed so far (a
+snapshot) before each piece of work.
+
+The candidate accepted is always the first one, in priority order, that
+passes. So the allocation produced is identical to that of testing them one
+at a time. Speculation only means that some candidates after it get tested
+for nothing.
+"""
+
+import multiprocessing
+from itertools import islice
+
+
+# How many candidates each piece of work sent to a worker contains.
+_CHUNK_SIZE = 4
+
+
+class SpeculativeChecker:
+    """
+    A pool of worker processes that test candidate chamber sets for AvoidsFP.
+    Call close() when finished with it.
+    """
+
+    def __init__(self, experiment_design, backend, workers):
+        """
+        Provide the same ExperimentDesign and backend as the AvoidsFP being
+        served, and how many worker processes to use.
+        """
+        self._pool = multiprocessing.Pool(workers, _init_worker,
+                (experiment_design, backend))
+        self._batch_size = workers * _CHUNK_SIZE
+
+
+    def first_invulnerable(self, commits, assay_P, candidates):
+        """
+        Commits is the list of (assay, chamber_set) placements committed so
+        far, in order. Provides (position, chamber_set) for the first of the
+        candidate chamber sets (in the order given) that assay_P could be
+        added to without making the allocation vulnerable. Or None, if there
+        is no such candidate.
+        """
+        candidates = iter(candidates)
+        position = 0
+        while True:
+            batch = list(islice(candidates, self._batch_size))
+            if not batch:
+                return None
+            starts = range(0, len(batch), _CHUNK_SIZE)
+            work = [(commits, assay_P, batch[start:start + _CHUNK_SIZE]) for
+                    start in starts]
+            # Results come back in order, so the first hit is the earliest.
+            for start, found in zip(starts, self._pool.imap(_test_chunk, work)):
+                if found is not None:
+                    return position + start + found, batch[start + found]
+            position += len(batch)
+
+
+    def close(self):
+        self._pool.terminate()
+        self._pool.join()
+
+
+#------------------------------------------------------------------------
+# Private / implementation functions below. These run in the workers.
+#------------------------------------------------------------------------
+
+# The worker's own allocator, and how many of the commits it has applied.
+_allocator = None
+_applied = 0
+
+def _init_worker(experiment_design, backend):
+    global _allocator
+    from lib.model.avoidfalsepos import AvoidsFP
+    _allocator = AvoidsFP(experiment_design, backend)
+
+
+def _test_chunk(work):
+    """
+    Provide the position within the chunk of the first candidate that would
+    not make the allocation vulnerable, or None.
+    """
+    global _applied
+    commits, assay_P, chunk = work
+    for assay, chamber_set in commits[_applied:]:
+        _allocator._commit(assay, chamber_set)
+    _applied = len(commits)
+    for position, chamber_set in enumerate(chunk):
+        if not _allocator._is_allocation_with_assay_P_added_vulnerable(
+                assay_P, chamber_set):
+            return position
+    return None
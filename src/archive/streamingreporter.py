@@ -0,0 +1,93 @@
+"""
+Writes the report for an allocation a line at a time, instead of building the
+whole report as one string, so that reporting on an allocation with
+thousands of chambers needs no more memory than one line of it.
+
+The report has two views of the allocation:
+
+    Reserved chambers   A line for each assay type, giving its number (the
+                        column it has in the matrix), its name, and the
+                        chambers it is in.
+
+    Matrix              A line for each chamber, with a column for each assay
+                        type, marked 'X' where the assay is in the chamber and
+                        '.' where it is not.
+
+The allocation is read from an AllocationFile, which can be memory-mapped, so
+that nothing but the line being written is ever unpacked.
+"""
+
+from lib.model.allocationfile import AllocationFile
+
+
+class StreamingReporter:
+    """
+    Writes the report for one allocation.
+    """
+
+    def __init__(self, allocation_file):
+        """
+        Provide the AllocationFile to report on.
+        """
+        self._allocation = allocation_file
+
+
+    @classmethod
+    def for_allocation(cls, experiment_design, alloc):
+        """
+        A reporter for an Allocation, made for the given ExperimentDesign.
+        """
+        return cls(AllocationFile.from_allocation(experiment_design, alloc))
+
+
+    def write(self, out, matrix=True):
+        """
+        Writes the report to out (a file, or anything else with a write()
+        method). The matrix view can be left out.
+        """
+        for line in self.lines(matrix):
+            out.write(line)
+            out.write('\n')
+
+
+    def lines(self, matrix=True):
+        """
+        Yields the lines of the report, without line endings.
+        """
+        allocation = self._allocation
+        assays = allocation.assays
+        for line in _HEADING.splitlines():
+            yield line
+        yield 'Assay types: %d' % len(assays)
+        yield 'Chambers: %d' % len(allocation.chambers)
+        yield 'Protects against up to %d simultaneous targets' % \
+                allocation.sim_targets
+        yield ''
+        yield 'RESERVED CHAMBERS'
+        yield ''
+        number_width = len(str(len(assays)))
+        name_width = max([len(assay) for assay in assays] + [1])
+        for number, assay in enumerate(assays, 1):
+            yield '%*d  %-*s  %s' % (number_width, number, name_width, assay,
+                    ', '.join(str(chamber) for chamber in
+                    sorted(allocation.chambers_for(assay))))
+        if not matrix:
+            return
+        yield ''
+        yield 'MATRIX (a line per chamber, a column per assay type)'
+        yield ''
+        column_for = dict((assay, column) for
+                column, assay in enumerate(assays))
+        chamber_width = max([len(str(chamber)) for
+                chamber in allocation.chambers] + [1])
+        for chamber in allocation.chambers:
+            marks = ['.'] * len(assays)
+            for assay in allocation.assays_in(chamber):
+                marks[column_for[assay]] = 'X'
+            yield '%*d  %s' % (chamber_width, chamber, ''.join(marks))
+
+
+_HEADING = \
+"""
+ASSAY ALLOCATION
+"""
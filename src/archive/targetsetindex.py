@@ -0,0 +1,42 @@
+"""
+An index over the possible target sets, keyed by member assay.
+
+When assay P is added to an allocation that was not vulnerable beforehand,
+any new way for a previously reserved chamber set to all-fire must involve P.
+So only the target sets that contain P need re-checking against those chamber
+sets. With 20 assays and sim_targets=5 that is C(19,4)=3876 target sets out of
+C(20,5)=15504.
+"""
+
+
+class TargetSetIndex:
+    """
+    Holds each possible target set alongside its bitmask, and provides the
+    subset of them that contain a given assay.
+    """
+
+    def __init__(self, target_sets, assay_bitmasks):
+        """
+        Provide the possible target sets (e.g. PossibleTargets.sets), and the
+        AssayBitmasks that define the bit for each assay.
+        """
+        # A list of (target_set_ADFN, target_mask_ADFN) pairs.
+        self.entries = [(target_set_ADFN, assay_bitmasks.mask_for(
+                target_set_ADFN)) for target_set_ADFN in target_sets]
+        # Assay -> the entries whose target set contains that assay.
+        self._containing = {}
+        for entry in self.entries:
+            for assay in entry[0]:
+                self._containing.setdefault(assay, []).append(entry)
+
+
+    def __len__(self):
+        return len(self.entries)
+
+
+    def containing(self, assay):
+        """
+        Provide the (target_set_ADFN, target_mask_ADFN) entries whose target
+        set includes the given assay.
+        """
+        return self._containing.get(assay, [])
@@ -0,0 +1,95 @@
+"""
+Keeps the expensive preparations that an allocator makes before it starts
+searching, so that a long-running process (see alloc-service.py) can reuse
+them for later requests with the same dimensions.
+
+Two things are kept:
+
+    The possible target sets (PossibleTargets) and their TargetSetIndex,
+    keyed by the assay types in priority order, and sim_targets. These take
+    most of an AvoidsFP's start up time, and are never altered once built.
+
+    A pristine (full) ChamberSetPool, keyed by the chambers and the chamber
+    set size. Allocators deplete their pool as they go, so each is given a
+    copy of the pristine one.
+
+Only the most recently used few of each are kept, so that a service that sees
+many different designs does not grow without limit.
+
+The preparations are built by the process that uses them and are not shared
+between processes. (Each worker process of the service has its own.)
+"""
+
+from collections import OrderedDict
+
+from lib.model import PossibleTargets
+from lib.model.chambersetpool import ChamberSetPool
+from lib.model.targetsetindex import TargetSetIndex
+
+
+class WarmCache:
+    """
+    The reusable preparations of the allocators in this process.
+    """
+
+    def __init__(self, max_entries=8):
+        """
+        Max_entries is how many of each kind of preparation to keep.
+        """
+        self._max_entries = max_entries
+        self._target_sets = OrderedDict()
+        self._pools = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+
+    def target_sets(self, experiment_design, assay_bitmasks):
+        """
+        Provides (possible_target_sets, target_set_index) for the given
+        ExperimentDesign. The AssayBitmasks must be one made for the
+        design's assay types in priority order (their bits depend on it).
+        """
+        key = (tuple(experiment_design.assay_types_in_priority_order()),
+                experiment_design.sim_targets)
+        found = self._lookup(self._target_sets, key)
+        if found is None:
+            possible_target_sets = PossibleTargets.create(
+                    experiment_design, experiment_design.sim_targets)
+            found = (possible_target_sets, TargetSetIndex(
+                    possible_target_sets.sets, assay_bitmasks))
+            self._store(self._target_sets, key, found)
+        return found
+
+
+    def chamber_set_pool(self, chambers, size):
+        """
+        Provides a full ChamberSetPool of the given chambers and size, which
+        the caller is free to deplete.
+        """
+        key = (tuple(sorted(chambers)), size)
+        pristine = self._lookup(self._pools, key)
+        if pristine is None:
+            pristine = ChamberSetPool(chambers, size)
+            self._store(self._pools, key, pristine)
+        return pristine.copy()
+
+
+    #------------------------------------------------------------------------
+    # Private / implementation methods below.
+    #------------------------------------------------------------------------
+
+    def _lookup(self, entries, key):
+        found = entries.pop(key, None)
+        if found is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        # Now the most recently used.
+        entries[key] = found
+        return found
+
+
+    def _store(self, entries, key, value):
+        entries[key] = value
+        while len(entries) > self._max_entries:
+            entries.popitem(last=False)
@@ -1,25 +1,92 @@
 """
 A command line program that runs the assay allocator taking parameters from
 the command line.
+
+If the allocation service (alloc-service.py) is running, the allocation is
+done there, which saves this program from having to import and prepare
+everything itself. So nothing else is imported until it turns out that the
+service is not running. Set the ASSAY_ALLOC_SERVICE environment variable to
+the host:port the service listens on (if it is not the default), or to "off"
+to never use it.
+
+Allocations are cached on disk (see AllocationCache), so repeating a request
+is quick. Set the ASSAY_ALLOC_CACHE environment variable to choose where the
+cache lives.
 """
+import json
+import os
+import socket
 import sys
 
-from lib.model.experimentreporter import ExperimentReporter
+# (Must match alloc-service.py.)
+SERVICE_ADDRESS_VARIABLE = 'ASSAY_ALLOC_SERVICE'
+DEFAULT_ADDRESS = '127.0.0.1:8754'
 
-from lib.model.depletingpoolallocator import DepletingPoolAllocator
-from lib.model.experimentfromcmdline import ExperimentFromCmdLine
+# How long to wait for the service to accept a connection, before deciding
+# that it is not running.
+_CONNECT_TIMEOUT = 0.2
 
 
 def run():
+    report_txt = _report_from_service()
+    if report_txt is None:
+        report_txt = _report_made_here()
+    print report_txt
+
+
+def _report_from_service():
+    """
+    Provides the report made by the service, or None if the service is not
+    running (or the command line needs reporting on here).
+    """
+    address = os.environ.get(SERVICE_ADDRESS_VARIABLE) or DEFAULT_ADDRESS
+    if address == 'off':
+        return None
+    host, port = address.rsplit(':', 1)
+    try:
+        connection = socket.create_connection((host, int(port)),
+                _CONNECT_TIMEOUT)
+    except (socket.error, ValueError):
+        return None
+    try:
+        # Allocating can take a long time.
+        connection.settimeout(None)
+        request = json.dumps({'id': 1, 'argv': sys.argv})
+        connection.sendall(request.encode('utf-8') + b'\n')
+        response = connection.makefile('rb').readline()
+    except socket.error:
+        return None
+    finally:
+        connection.close()
+    if not response:
+        return None
+    response = json.loads(response.decode('utf-8'))
+    if 'error' not in response:
+        return response['report']
+    if response.get('usage'):
+        # Parse it here, so that the usage message comes out as usual.
+        return None
+    sys.stderr.write(response['error'] + '\n')
+    sys.exit(1)
+
+
+def _report_made_here():
+    from lib.model.experimentreporter import ExperimentReporter
+
+    from lib.model.allocationcache import AllocationCache
+    from lib.model.depletingpoolallocator import DepletingPoolAllocator
+    from lib.model.experimentfromcmdline import ExperimentFromCmdLine
+
     experiment_design = ExperimentFromCmdLine.make(sys.argv)
-    allocator = DepletingPoolAllocator(experiment_design)
-    assay_allocation = allocator.allocate()
+    cache = AllocationCache()
+    try:
+        assay_allocation = cache.allocate(experiment_design,
+                DepletingPoolAllocator)
+    finally:
+        cache.close()
     reporter = ExperimentReporter(experiment_design, assay_allocation)
-    report_txt = reporter.report()
-    print report_txt
+    return reporter.report()
 
 
 if __name__ == '__main__':
     run()
-
-
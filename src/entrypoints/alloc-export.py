@@ -0,0 +1,33 @@
+"""
+A command line program that runs the assay allocator, as alloc-cmdline.py
+does, but saves the allocation as an allocation file (see AllocationFile)
+instead of printing a report. The first argument is the file to write, and
+the rest are those that alloc-cmdline.py takes.
+
+    alloc-export.py allocation.aalc <alloc-cmdline.py arguments>
+"""
+import sys
+
+from lib.model.allocationcache import AllocationCache
+from lib.model.allocationfile import AllocationFile
+from lib.model.depletingpoolallocator import DepletingPoolAllocator
+from lib.model.experimentfromcmdline import ExperimentFromCmdLine
+
+
+def run():
+    if len(sys.argv) < 2:
+        sys.exit(__doc__.strip())
+    output = sys.argv[1]
+    experiment_design = ExperimentFromCmdLine.make(sys.argv[:1] +
+            sys.argv[2:])
+    cache = AllocationCache()
+    try:
+        assay_allocation = cache.allocate(experiment_design,
+                DepletingPoolAllocator)
+    finally:
+        cache.close()
+    AllocationFile.save(output, experiment_design, assay_allocation)
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,24 @@
+"""
+A command line program that runs a portfolio of assay allocators in parallel,
+taking parameters from the command line, and reports the first valid
+allocation that any of them produces.
+"""
+import sys
+
+from lib.model.experimentreporter import ExperimentReporter
+
+from lib.model.experimentfromcmdline import ExperimentFromCmdLine
+from lib.model.portfolioallocator import PortfolioAllocator
+
+
+def run():
+    experiment_design = ExperimentFromCmdLine.make(sys.argv)
+    allocator = PortfolioAllocator(experiment_design)
+    assay_allocation = allocator.allocate()
+    reporter = ExperimentReporter(experiment_design, assay_allocation)
+    report_txt = reporter.report()
+    print(report_txt)
+
+
+if __name__ == '__main__':
+    run()
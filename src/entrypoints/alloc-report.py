@@ -0,0 +1,34 @@
+"""
+A command line program that prints the report for an allocation file (see
+AllocationFile), a line at a time, so that even very large allocations are
+reported on in little memory.
+"""
+import argparse
+import sys
+
+from lib.model.allocationfile import AllocationFile
+from lib.model.streamingreporter import StreamingReporter
+
+
+def run():
+    args = _parse_args()
+    allocation_file = AllocationFile.open(args.file, verify=args.verify)
+    try:
+        StreamingReporter(allocation_file).write(sys.stdout,
+                matrix=not args.no_matrix)
+    finally:
+        allocation_file.close()
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('file', help='The allocation file to report on.')
+    parser.add_argument('--no-matrix', action='store_true',
+            help='Leave out the chamber by assay type matrix.')
+    parser.add_argument('--verify', action='store_true',
+            help='Check the file\'s CRC-32 first.')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,219 @@
+"""
+A long-running allocation service, so that each allocation requested does
+not pay for starting Python, importing everything, and (for AvoidsFP)
+preparing the possible target sets and the pool of chamber sets afresh.
+
+    alloc-service.py                Listens on a local TCP port.
+    alloc-service.py --stdio        Reads requests from stdin, and writes
+                                    responses to stdout.
+
+Requests and responses are one line of JSON each. A request gives the
+command line that alloc-cmdline.py would have been run with, and optionally
+the allocator to use (by default, the same as alloc-cmdline.py):
+
+    {"id": 7, "argv": ["alloc-cmdline.py", ...], "allocator": "avoidsfp"}
+
+The response carries the same id, and either the text report or an error:
+
+    {"id": 7, "report": "...", "seconds": 0.01}
+    {"id": 7, "error": "...", "usage": false}
+
+(Usage is true when the error was in the command line given.)
+
+Requests are handled by a pool of worker processes, so several can be in
+hand at once. Each worker keeps a WarmCache of the preparations it has
+made, and they all share the on-disk AllocationCache. Over TCP, each
+connection's requests are answered in order. On stdio, responses are written
+as soon as they are ready, which may not be the order the requests came in.
+
+alloc-cmdline.py uses the service when it is running. The address it listens
+on is 127.0.0.1:8754, unless the ASSAY_ALLOC_SERVICE environment variable
+says otherwise (as host:port).
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import threading
+import time
+try:
+    import socketserver
+except ImportError:
+    import SocketServer as socketserver # Python 2.
+
+from lib.model.experimentreporter import ExperimentReporter
+
+from lib.model.allocationcache import AllocationCache
+from lib.model.avoidfalsepos import AvoidsFP
+from lib.model.depletingpoolallocator import DepletingPoolAllocator
+from lib.model.diagonals import DiagonalsAllocator
+from lib.model.experimentfromcmdline import ExperimentFromCmdLine
+from lib.model.warmcache import WarmCache
+
+# The environment variable that can be used to say where the service listens.
+SERVICE_ADDRESS_VARIABLE = 'ASSAY_ALLOC_SERVICE'
+DEFAULT_ADDRESS = '127.0.0.1:8754'
+
+allocators = {
+    'avoidsfp': AvoidsFP,
+    'depletingpool': DepletingPoolAllocator,
+    'diagonals': DiagonalsAllocator,
+}
+
+# Each worker process's own caches. (Set up by _start_worker.)
+_warm_cache = None
+_allocation_cache = None
+
+def run():
+    args = _parse_args()
+    pool = multiprocessing.Pool(args.workers, _start_worker)
+    try:
+        if args.stdio:
+            _serve_stdio(pool)
+        else:
+            _serve_tcp(pool, _address(args.address))
+    finally:
+        pool.terminate()
+        pool.join()
+
+def _serve_stdio(pool):
+    lock = threading.Lock()
+    def _respond(response):
+        with lock:
+            sys.stdout.write(json.dumps(response, sort_keys=True) + '\n')
+            sys.stdout.flush()
+    pending = []
+    for line in iter(sys.stdin.readline, ''):
+        if not line.strip():
+            continue
+        request = _parse_request(line)
+        if 'error' in request:
+            _respond(request)
+            continue
+        pending.append(pool.apply_async(_handle, (request,),
+                callback=_respond))
+    # Stdin is closed. Finish what was asked for before stopping.
+    for result in pending:
+        result.wait()
+
+def _serve_tcp(pool, address):
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            for line in iter(self.rfile.readline, b''):
+                if not line.strip():
+                    continue
+                request = _parse_request(line.decode('utf-8'))
+                if 'error' in request:
+                    response = request
+                else:
+                    response = pool.apply(_handle, (request,))
+                self.wfile.write(json.dumps(response,
+                        sort_keys=True).encode('utf-8') + b'\n')
+                self.wfile.flush()
+
+    socketserver.ThreadingTCPServer.allow_reuse_address = True
+    server = socketserver.ThreadingTCPServer(address, Handler)
+    server.daemon_threads = True
+    sys.stderr.write('Allocation service listening on %s:%d\n' % address)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+def _parse_request(line):
+    """
+    Provides the request, or an error response if it cannot be understood.
+    """
+    try:
+        request = json.loads(line)
+    except ValueError as e:
+        return {'id': None, 'error': 'Bad request: %s' % e, 'usage': False}
+    if not isinstance(request, dict) or \
+            not isinstance(request.get('argv'), list):
+        return {'id': None, 'error': 'Bad request: no argv given',
+                'usage': False}
+    if request.get('allocator', 'depletingpool') not in allocators:
+        return {'id': request.get('id'), 'usage': False,
+                'error': 'Unknown allocator: %s' % request['allocator']}
+    return request
+
+def _start_worker():
+    """
+    Runs in each worker process as it starts.
+    """
+    global _warm_cache, _allocation_cache
+    # Anything printed along the way must not get mixed up with the
+    # responses.
+    sys.stdout = sys.stderr
+    _warm_cache = WarmCache()
+    _allocation_cache = AllocationCache()
+
+def _handle(request):
+    """
+    Runs in a worker process.
+    """
+    response = {'id': request.get('id')}
+    started = time.time()
+    try:
+        experiment_design = ExperimentFromCmdLine.make(
+                [str(arg) for arg in request['argv']])
+    except SystemExit:
+        response.update({'error': 'Invalid command line', 'usage': True})
+        return response
+    except ValueError as e:
+        response.update({'error': str(e), 'usage': True})
+        return response
+    except Exception as e:
+        # Whatever goes wrong, the client must get an answer.
+        response.update({'error': '%s: %s' % (type(e).__name__, e),
+                'usage': False})
+        return response
+    allocator_class = allocators[request.get('allocator', 'depletingpool')]
+    try:
+        alloc = _allocate(experiment_design, allocator_class)
+        reporter = ExperimentReporter(experiment_design, alloc)
+        response['report'] = reporter.report()
+    except Exception as e:
+        response.update({'error': '%s: %s' % (type(e).__name__, e),
+                'usage': False})
+        return response
+    response['seconds'] = round(time.time() - started, 4)
+    return response
+
+def _allocate(experiment_design, allocator_class):
+    key = AllocationCache.key(experiment_design, allocator_class)
+    alloc = _allocation_cache.get(key)
+    if alloc is None:
+        if allocator_class is AvoidsFP:
+            allocator = AvoidsFP(experiment_design, warm_cache=_warm_cache)
+        else:
+            allocator = allocator_class(experiment_design)
+        alloc = allocator.allocate()
+        _allocation_cache.put(key, alloc)
+    return alloc
+
+def _address(address):
+    address = address or os.environ.get(SERVICE_ADDRESS_VARIABLE) or \
+            DEFAULT_ADDRESS
+    host, port = address.rsplit(':', 1)
+    return host, int(port)
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip(),
+            formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--stdio', action='store_true',
+            help='Serve requests from stdin instead of a TCP port.')
+    parser.add_argument('--address',
+            help='host:port to listen on. (Overrides %s.)' %
+            SERVICE_ADDRESS_VARIABLE)
+    parser.add_argument('--workers', type=int,
+            default=multiprocessing.cpu_count(),
+            help='Worker processes. (Defaults to the number of CPUs.)')
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    run()
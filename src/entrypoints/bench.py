@@ -0,0 +1,193 @@
+"""
+A command line program that benchmarks the allocators over a fixed grid of
+experiment designs, and compares two sets of benchmark results.
+
+    bench.py run --output results.json
+    bench.py compare before.json after.json
+
+Each allocator is run on each design point in a child process of its own, so
+that its peak memory can be measured in isolation. For each, the wall time
+(the best of the repeats), peak memory, and the allocator's own counters (the
+candidate chamber sets tested, and target sets given the all-firing test, for
+those allocators that keep count) are recorded.
+
+Compare reports the change in wall time for each case common to both runs,
+and exits with a non-zero status if any got slower by more than the
+threshold, or changed outcome.
+"""
+
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+
+from lib.model.experimentdesign import ExperimentDesign
+
+from lib.model.avoidfalsepos import AvoidsFP
+from lib.model.depletingpoolallocator import DepletingPoolAllocator
+from lib.model.diagonals import DiagonalsAllocator
+from lib.model.processrunner import ProcessRunner
+
+allocators = {
+    'avoidsfp': AvoidsFP,
+    'depletingpool': DepletingPoolAllocator,
+    'diagonals': DiagonalsAllocator,
+}
+
+# (assays, chambers, sim_targets, dont-mix pairs). Don't change these
+# lightly: results are only comparable for the same design points.
+grid = (
+    (12, 16, 3, 0),
+    (15, 20, 3, 2),
+    (16, 18, 3, 0),
+    (20, 26, 3, 3),
+    (14, 24, 3, 7),
+    (10, 20, 4, 0),
+    (20, 30, 4, 4),
+    (25, 40, 4, 0),
+)
+
+def run():
+    args = _parse_args()
+    if args.command == 'run':
+        _run_benchmarks(args)
+    else:
+        sys.exit(_compare(args))
+
+def _run_benchmarks(args):
+    names = args.allocator or sorted(allocators)
+    jobs = [(name, point) for point in grid for name in names]
+    results = []
+    runner = ProcessRunner(1, args.timeout)
+    for job in jobs:
+        best = None
+        for repeat in range(args.repeat):
+            outcome, = runner.run(_benchmark, [job])
+            if outcome.status != 'done':
+                best = {'status': outcome.status, 'error': outcome.error}
+                break
+            if best is None or outcome.value['seconds'] < best['seconds']:
+                best = outcome.value
+        name, point = job
+        result = {'allocator': name, 'assays': point[0],
+                'chambers': point[1], 'sim_targets': point[2],
+                'dont_mix': point[3]}
+        result.update(best)
+        results.append(result)
+        print('%-14s %-18s %-8s %s' % (name, point, result['status'],
+                _seconds_column(result)))
+
+    with open(args.output, 'w') as f:
+        json.dump({'meta': _meta(), 'results': results}, f, indent=1,
+                sort_keys=True)
+
+def _benchmark(job):
+    """
+    Runs in a child process.
+    """
+    name, point = job
+    experiment_design = ExperimentDesign.make_from_params(*point)
+    started = time.time()
+    allocator = allocators[name](experiment_design)
+    try:
+        allocator.allocate()
+        status = 'worked'
+    except RuntimeError:
+        status = 'failed'
+    seconds = time.time() - started
+    result = {'status': status, 'seconds': round(seconds, 4),
+            'peak_memory_kb': _peak_memory_kb(),
+            'candidates_tried': None, 'target_sets_checked': None}
+    # Not every allocator keeps count.
+    stats = getattr(allocator, 'stats', None)
+    if stats is not None:
+        result['candidates_tried'] = stats.vulnerability_checks
+        result['target_sets_checked'] = stats.all_fire_tests
+        result['stats'] = stats.as_dict()
+    return result
+
+def _peak_memory_kb():
+    try:
+        import resource
+    except ImportError:
+        return None # Not available on Windows.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        peak //= 1024 # Reported in bytes, not kilobytes.
+    return peak
+
+def _meta():
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+                stderr=subprocess.STDOUT).decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'commit': commit, 'python': platform.python_version(),
+            'machine': platform.machine(), 'when': time.time()}
+
+def _compare(args):
+    before = _load_results(args.before)
+    after = _load_results(args.after)
+    regressions = 0
+    print('%-14s %-18s %10s %10s %8s' % ('ALLOCATOR', 'DESIGN', 'BEFORE',
+            'AFTER', 'CHANGE'))
+    for key in sorted(set(before) & set(after)):
+        old, new = before[key], after[key]
+        name, point = key[0], key[1:]
+        if old['status'] != new['status']:
+            regressions += 1
+            print('%-14s %-18s %10s %10s %8s' % (name, point, old['status'],
+                    new['status'], 'OUTCOME'))
+            continue
+        if 'seconds' not in old or 'seconds' not in new:
+            continue
+        change = (new['seconds'] - old['seconds']) / max(old['seconds'],
+                1e-6)
+        flag = ''
+        if change > args.threshold:
+            regressions += 1
+            flag = ' <-- slower'
+        print('%-14s %-18s %10.4f %10.4f %+7.1f%%%s' % (name, point,
+                old['seconds'], new['seconds'], change * 100, flag))
+    return 1 if regressions else 0
+
+def _load_results(path):
+    with open(path) as f:
+        results = json.load(f)['results']
+    return dict(((r['allocator'], r['assays'], r['chambers'],
+            r['sim_targets'], r['dont_mix']), r) for r in results)
+
+def _seconds_column(result):
+    if 'seconds' not in result:
+        return ''
+    return '%.4fs' % result['seconds']
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip(),
+            formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    run_parser = commands.add_parser('run', help='Run the benchmarks.')
+    run_parser.add_argument('--output', default='bench-results.json',
+            help='File to write the results to.')
+    run_parser.add_argument('--allocator', action='append',
+            choices=sorted(allocators),
+            help='Only benchmark this allocator. (Can be repeated.)')
+    run_parser.add_argument('--repeat', type=int, default=3,
+            help='Runs of each case, of which the fastest is recorded.')
+    run_parser.add_argument('--timeout', type=float, default=300,
+            help='Seconds allowed for each run.')
+
+    compare_parser = commands.add_parser('compare',
+            help='Compare two sets of results.')
+    compare_parser.add_argument('before')
+    compare_parser.add_argument('after')
+    compare_parser.add_argument('--threshold', type=float, default=0.1,
+            help='Fractional slow-down that counts as a regression.')
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    run()
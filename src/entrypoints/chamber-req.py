@@ -1,14 +1,22 @@
-import math
+"""
+Prints lower bounds on the number of chambers required, for a range of
+experiment sizes. These are worked out in exact integer arithmetic, from the
+same bounds that the allocators use to reject impossible designs.
+"""
+from lib.model.feasibility import Feasibility
 
 for assays in (20, 40, 80):
     for sim_targets in (3,4,5):
-        # In n-choose-k notation
-        n = assays
-        k = sim_targets
-        combis_required = math.factorial(n) / float((math.factorial(k) * math.factorial(n - k)))
+        feasibility = Feasibility(assays, None, sim_targets)
+        # Every combination of up to sim_targets targets must give a
+        # different firing pattern.
+        combis_required = feasibility.target_combinations()
+        chambers_int = feasibility.information_min_chambers()
+        # AvoidsFP also needs room for sim_targets + 1 replicas per assay,
+        # with no two assays sharing more than one chamber.
+        avoidsfp_chambers = feasibility.packing_min_chambers(
+                sim_targets + 1, 1)
 
-        chambers_float = math.log(combis_required, 2)
-        chambers_int = math.ceil(chambers_float)
-
-        print('sim_targets: %d, assays %d, combis: %d, chamber required: %d' %
-              (sim_targets, assays, combis_required, chambers_int))
+        print('sim_targets: %d, assays %d, combis: %d, chamber required: %d, '
+              'for AvoidsFP: %d' % (sim_targets, assays, combis_required,
+              chambers_int, avoidsfp_chambers))
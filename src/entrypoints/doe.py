@@ -2,33 +2,155 @@
 A command line program that trys to do an allocation multiple times, with
 different settings each time. Prints a success / fail line of output for each
 attempt made.
+
+The design points are shared out over a pool of worker processes. Each result
+(status, wall time, candidates tried, and whether the allocation passed the
+false-positive certifier) is appended to a results file as soon as it is
+known. Points that already have a result in that file are skipped, so an
+interrupted sweep can simply be re-run. Any point that takes longer than
+the time limit is recorded as having timed out.
+
+Points that an allocator's feasibility bounds rule out are recorded as
+infeasible, along with the bound responsible, without searching. An
+allocation that the certifier shows to be vulnerable to false positives is
+recorded as uncertified, not as having worked.
+
+In min-chambers mode, it instead finds the fewest chambers that work for each
+combination of targets and assays, by bisection. (See MinChamberSearch.)
 """
 
+import argparse
+
 from lib.model.experimentdesign import ExperimentDesign
 
+from lib.model.avoidfalsepos import AvoidsFP
 from lib.model.depletingpoolallocator import DepletingPoolAllocator
+from lib.model.diagonals import DiagonalsAllocator
+from lib.model.doeresultstore import DoeResultStore
+from lib.model.fpcertifier import FalsePositiveCertifier
+from lib.model.minchambersearch import MinChamberSearch
+from lib.model.processrunner import ProcessRunner
 
 all_targets = (3,4,5)
 all_assays = (13,16,18,20,22,25)
 all_chambers = (14,17,19,21,23,26)
 
+allocators = {
+    'avoidsfp': AvoidsFP,
+    'depletingpool': DepletingPoolAllocator,
+    'diagonals': DiagonalsAllocator,
+}
+
+# Results with these statuses mean a design point need not be run again.
+# (Those that ended in an unexpected error are retried.)
+_FINAL_STATUSES = ('worked', 'failed', 'uncertified', 'timeout',
+        'infeasible')
+
 def run():
+    args = _parse_args()
+    if args.mode == 'min-chambers':
+        _run_min_chambers(args)
+        return
+    store = DoeResultStore(args.results)
+    done = store.done_keys(_FINAL_STATUSES)
+    points = [p for p in _design_points(args.allocator) if
+            DoeResultStore.key(p) not in done]
+
     print('TARGETS, ASSAYS, CHAMBERS, WORKED')
+    runner = ProcessRunner(args.workers, args.timeout)
+    for outcome in runner.run(_try_design_point, points):
+        result = dict(outcome.job)
+        result['seconds'] = round(outcome.seconds, 3)
+        if outcome.status == 'done':
+            result.update(outcome.value)
+        else:
+            result['status'] = outcome.status
+            result['error'] = outcome.error
+        store.append(result)
+        print('%d, %d, %d, %s' % (result['targets'], result['assays'],
+                result['chambers'], _worked_column(result['status'])))
+
+def _run_min_chambers(args):
+    print('TARGETS, ASSAYS, MIN CHAMBERS, ATTEMPTS')
+    for targets in all_targets:
+        for assays in all_assays:
+            search = MinChamberSearch(allocators[args.allocator], assays,
+                    targets, timeout=args.timeout,
+                    max_chambers=args.max_chambers)
+            result = search.search()
+            min_chambers = result.min_chambers
+            if min_chambers is None:
+                min_chambers = '>%d' % args.max_chambers
+            print('%d, %d, %s, %d' % (targets, assays, min_chambers,
+                    len(result.attempts)))
+
+def _design_points(allocator):
     for targets in all_targets:
         for assays in all_assays:
             for chambers in all_chambers:
-                experiment_design = ExperimentDesign.make_from_params(
-                        assays, chambers, targets, 0)
-                allocator = DepletingPoolAllocator(experiment_design)
-                try:
-                    assay_allocation = allocator.allocate()
-                    status = 'y'
-                except RuntimeError as e:
-                    status = ''
-                print('%d, %d, %d, %s' % (targets, assays, chambers, status))
+                yield {'allocator': allocator, 'targets': targets,
+                        'assays': assays, 'chambers': chambers}
+
+def _try_design_point(point):
+    """
+    Runs in a worker process.
+    """
+    experiment_design = ExperimentDesign.make_from_params(
+            point['assays'], point['chambers'], point['targets'], 0)
+    allocator_class = allocators[point['allocator']]
+    # Not every allocator knows its feasibility bounds.
+    feasibility = getattr(allocator_class, 'feasibility', None)
+    if feasibility is not None:
+        verdict = feasibility(experiment_design)
+        if verdict.ruled_out:
+            return {'status': 'infeasible', 'bound': verdict.bound,
+                    'reason': verdict.reason}
+    allocator = allocator_class(experiment_design)
+    certified = None
+    try:
+        assay_allocation = allocator.allocate()
+        # Check the allocation independently of the allocator. (Already in
+        # a worker process, so the certifier need not start more.)
+        certifier = FalsePositiveCertifier(point['targets'], workers=1)
+        certified = certifier.certify(assay_allocation).certified
+        status = 'worked' if certified else 'uncertified'
+    except RuntimeError as e:
+        status = 'failed'
+    # Not every allocator keeps count.
+    candidates_tried = None
+    stats = getattr(allocator, 'stats', None)
+    if stats is not None:
+        candidates_tried = stats.vulnerability_checks
+    return {'status': status, 'candidates_tried': candidates_tried,
+            'certified': certified}
+
+def _worked_column(status):
+    if status == 'worked':
+        return 'y'
+    if status == 'failed':
+        return ''
+    if status == 'uncertified':
+        return 'FP'
+    return status
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--results', default='doe-results.jsonl',
+            help='File to append results to, and to resume from.')
+    parser.add_argument('--workers', type=int, default=None,
+            help='Number of worker processes. (Default: one per CPU.)')
+    parser.add_argument('--timeout', type=float, default=None,
+            help='Seconds allowed for each design point. (Default: no limit.)')
+    parser.add_argument('--allocator', choices=sorted(allocators),
+            default='depletingpool')
+    parser.add_argument('--mode', choices=('sweep', 'min-chambers'),
+            default='sweep',
+            help='Try every design point, or find the fewest chambers that '
+            'work for each number of targets and assays.')
+    parser.add_argument('--max-chambers', type=int, default=256,
+            help='The most chambers to try in min-chambers mode.')
+    return parser.parse_args()
 
 if __name__ == '__main__':
     # Run normally
     run()
-
-
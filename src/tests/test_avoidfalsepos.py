@@ -0,0 +1,183 @@
+"""
+Tests of the AvoidsFP allocator.
+
+The allocations it makes, for a few fixed designs (some with dont-mix rules),
+are pinned: to those the serial python backend made before its optimisations,
+and then every other way of running it (the other backends, the workers, the
+symmetry breaking, and extending an existing allocation) must make the same
+ones.
+
+Its candidate ordering must be the order of sorting the whole pool, and the
+memory it needs must not grow with the pool.
+"""
+
+import unittest
+try:
+    import numpy
+except ImportError:
+    numpy = None
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None # Python 2.
+
+from lib.model import Allocation
+from lib.model.experimentdesign import ExperimentDesign
+
+from lib.model.avoidfalsepos import AvoidsFP, _alphabetical
+from lib.model.chambersetpool import ChamberSetPool
+
+# (assays, chambers, sim_targets, dont-mix pairs) -> the chambers reserved
+# for each assay type, in priority order.
+PINNED = {
+    (8, 12, 2, 0): [
+        [1, 2, 3], [4, 5, 6], [7, 8, 9], [10, 11, 12], [1, 4, 7],
+        [2, 5, 10], [3, 6, 12], [1, 9, 11]],
+    (12, 18, 2, 5): [
+        [1, 2, 3], [4, 5, 6], [7, 8, 9], [10, 11, 12], [13, 14, 15],
+        [16, 17, 18], [1, 4, 7], [2, 5, 14], [3, 6, 15], [8, 10, 13],
+        [9, 11, 17], [1, 12, 18]],
+    (16, 22, 3, 6): [
+        [1, 2, 3, 4], [5, 6, 7, 8], [9, 10, 11, 12], [13, 14, 15, 16],
+        [17, 18, 19, 20], [1, 10, 21, 22], [2, 5, 14, 22], [3, 6, 12, 15],
+        [4, 8, 9, 13], [7, 11, 20, 21], [1, 8, 16, 17], [2, 7, 12, 18],
+        [5, 9, 15, 19], [3, 13, 20, 22], [4, 6, 14, 21], [3, 11, 16, 19]],
+}
+
+
+class _WithoutPruning(AvoidsFP):
+    """
+    With the pool pruning, the first candidate tested is never vulnerable,
+    so there would be no symmetric candidates to skip. Without it there are.
+    """
+
+    def _ditch_available_chamber_sets_that_inevitably_wont_work(
+            self, chamber_set_147):
+        pass
+
+
+class _WithoutPruningOrSymmetryBreaking(_WithoutPruning):
+
+    def _one_per_symmetry_class(self, chamber_sets):
+        return chamber_sets
+
+
+class TestAllocations(unittest.TestCase):
+
+    def test_python_backend(self):
+        for params, expected in sorted(PINNED.items()):
+            experiment_design = ExperimentDesign.make_from_params(*params)
+            alloc = AvoidsFP(experiment_design).allocate()
+            self.assertEqual(self._reserved(experiment_design, alloc),
+                    expected, params)
+
+
+    @unittest.skipIf(numpy is None, 'needs numpy')
+    def test_numpy_backend(self):
+        self._check_pinned(backend='numpy')
+
+
+    def test_cover_backend(self):
+        self._check_pinned(backend='cover')
+
+
+    def test_workers(self):
+        self._check_pinned(workers=2)
+
+
+    def test_symmetry_breaking_changes_nothing(self):
+        for params in sorted(PINNED):
+            experiment_design = ExperimentDesign.make_from_params(*params)
+            allocator = _WithoutPruning(experiment_design)
+            alloc = allocator.allocate()
+            unbroken = _WithoutPruningOrSymmetryBreaking(
+                    experiment_design).allocate()
+            self.assertEqual(self._reserved(experiment_design, alloc),
+                    self._reserved(experiment_design, unbroken), params)
+            # Or there would be nothing to show.
+            self.assertTrue(allocator.stats.symmetric_skips > 0, params)
+
+
+    def test_extending_an_existing_allocation(self):
+        for params, expected in sorted(PINNED.items()):
+            experiment_design = ExperimentDesign.make_from_params(*params)
+            assays = experiment_design.assay_types_in_priority_order()
+            existing = Allocation()
+            kept = len(assays) // 2
+            for assay, chambers in zip(assays[:kept], expected):
+                existing.allocate(assay, frozenset(chambers))
+            alloc = AvoidsFP(experiment_design).allocate(existing=existing)
+            self.assertEqual(self._reserved(experiment_design, alloc),
+                    expected, params)
+
+
+    def _check_pinned(self, **options):
+        for params, expected in sorted(PINNED.items()):
+            experiment_design = ExperimentDesign.make_from_params(*params)
+            alloc = AvoidsFP(experiment_design, **options).allocate()
+            self.assertEqual(self._reserved(experiment_design, alloc),
+                    expected, params)
+
+
+    def _reserved(self, experiment_design, alloc):
+        return [sorted(alloc.chambers_for(assay)) for assay in
+                experiment_design.assay_types_in_priority_order()]
+
+
+class TestCandidateOrder(unittest.TestCase):
+
+    def test_order_is_that_of_sorting_the_pool(self):
+        # Enough candidates for several batches, at several crowdednesses.
+        experiment_design = ExperimentDesign.make_from_params(12, 20, 2, 4)
+        allocator = AvoidsFP(experiment_design)
+        for assay in experiment_design.assay_types_in_priority_order()[:5]:
+            expected = self._sorted_pool(allocator, assay)
+            found = list(
+                    allocator._legal_available_chamber_sets_prioritised(assay))
+            self.assertEqual(found, expected)
+            allocator._allocate_all_replicas_of_this_assay_type(assay)
+
+
+    @unittest.skipIf(tracemalloc is None, 'needs tracemalloc')
+    def test_pool_of_40_chambers_under_half_a_megabyte(self):
+        tracemalloc.start()
+        try:
+            pool = ChamberSetPool(range(1, 41), 6)
+            size, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        self.assertEqual(len(pool), 3838380)
+        self.assertLess(peak, 512 * 1024)
+
+
+    @unittest.skipIf(tracemalloc is None, 'needs tracemalloc')
+    def test_first_candidate_needs_memory_of_a_batch_not_the_pool(self):
+        experiment_design = ExperimentDesign.make_from_params(8, 30, 5, 0)
+        allocator = AvoidsFP(experiment_design, backend='cover')
+        assay = experiment_design.assay_types_in_priority_order()[0]
+        pool_size = len(allocator._available_chamber_sets)
+        tracemalloc.start()
+        try:
+            candidates = \
+                    allocator._legal_available_chamber_sets_prioritised(assay)
+            next(candidates)
+            size, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        # Far less than a key of 8 bytes for each chamber set in the pool.
+        self.assertLess(peak, pool_size)
+
+
+    def _sorted_pool(self, allocator, assay):
+        def how_crowded(chamber_set):
+            return sum(allocator._masks.occupancy(chamber) for
+                    chamber in chamber_set)
+        legal = [chamber_set for chamber_set in
+                allocator._available_chamber_sets if
+                allocator._dont_mix.allowed(assay, chamber_set)]
+        return sorted(legal, key=lambda chamber_set:
+                (how_crowded(chamber_set), _alphabetical(chamber_set)))
+
+
+if __name__ == '__main__':
+    unittest.main()
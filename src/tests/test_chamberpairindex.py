@@ -0,0 +1,41 @@
+"""
+Tests that pruning the pool through the ChamberPairIndex leaves exactly the
+chamber sets that the original list comprehension did.
+"""
+
+import random
+import unittest
+
+from lib.model.chamberpairindex import ChamberPairIndex
+from lib.model.chambersetpool import ChamberSetPool
+
+
+class TestChamberPairIndex(unittest.TestCase):
+
+    def test_survivors_match_list_comprehension(self):
+        randomiser = random.Random(7)
+        for num_chambers, size in ((8, 3), (12, 4), (14, 5), (16, 6)):
+            chambers = range(1, num_chambers + 1)
+            pool = ChamberSetPool(chambers, size)
+            index = ChamberPairIndex(pool)
+            expected = list(pool)
+            for reservation in range(4):
+                reserved = frozenset(randomiser.sample(chambers, size))
+                expected = [cs for cs in expected if len(cs & reserved) <= 1]
+                before = len(pool)
+                removed = index.discard_sharing_a_pair_with(reserved)
+                self.assertEqual(list(pool), expected)
+                self.assertEqual(len(pool), len(expected))
+                self.assertEqual(removed, before - len(expected))
+
+
+    def test_ranks_containing_a_pair(self):
+        pool = ChamberSetPool(range(1, 11), 4)
+        index = ChamberPairIndex(pool)
+        ranks = list(index.ranks_containing(3, 7))
+        expected = [pool.rank(cs) for cs in pool if 3 in cs and 7 in cs]
+        self.assertEqual(ranks, expected)
+
+
+if __name__ == '__main__':
+    unittest.main()